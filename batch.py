@@ -0,0 +1,90 @@
+'''
+Vectorized evaluation of many boards at once.
+
+Boards are stacked into an (N, grid_height, grid_width) array and every step
+(locking a piece, clearing lines, extracting features) is a single NumPy
+operation over the whole stack, so a full move list can be scored in one call
+instead of one add_to_grid/clear_lines round-trip per candidate.
+'''
+
+import numpy as np
+
+from engine import piece_sets
+
+# Define the weights used to score a board from its features
+default_weights = {
+    "aggregate_height": -0.510066,
+    "lines_cleared": 0.760666,
+    "holes": -0.35663,
+    "bumpiness": -0.184483
+}
+
+# Stack a list of (piece key, rotation state) pairs into (N, size, size) shapes and IDs
+def stack_pieces(pieces, piece_set=piece_sets["tetrominoes"]):
+    orientations = piece_set["orientations"]
+    shapes = np.stack([orientations[key][state]["shape"] for key, state in pieces])
+    ids = np.array([piece_set["pieces"][key]["ID"] for key, _ in pieces])
+    return shapes, ids
+
+# Lock one piece into each board. shapes is (N, size, size), positions is (N, 2)
+# and ids is (N,); the positions must be valid for their boards.
+def add_to_grid_batch(boards, shapes, ids, positions):
+    new_boards = boards.copy()
+    n, i, j = np.nonzero(shapes)
+    positions = np.asarray(positions)
+    new_boards[n, positions[n, 0] + i, positions[n, 1] + j] = np.asarray(ids)[n]
+    return new_boards
+
+# Clear the full lines of every board in place, returning the boards and lines cleared per board
+def clear_lines_batch(boards):
+    full = (boards != 0).all(axis=2)
+    cleared_lines = full.sum(axis=1)
+
+    # Move full rows to the top, keeping the order of the others, then empty
+    # them; only the boards that cleared something are touched
+    cleared = np.flatnonzero(cleared_lines)
+    if len(cleared):
+        order = np.argsort(~full[cleared], axis=1, kind="stable")
+        moved = np.take_along_axis(boards[cleared], order[:, :, None], axis=1)
+        moved[np.arange(boards.shape[1])[None, :] < cleared_lines[cleared, None]] = 0
+        boards[cleared] = moved
+    return boards, cleared_lines
+
+# Compute column heights, holes and bumpiness of every board
+def board_features_batch(boards):
+    height = boards.shape[1]
+    filled = boards != 0
+
+    # A column's height is measured from its topmost filled cell
+    heights = np.where(filled.any(axis=1), height - filled.argmax(axis=1), 0)
+
+    # A hole is an empty cell with a filled cell somewhere above it
+    covered = np.logical_or.accumulate(filled, axis=1)
+    holes = (covered & ~filled).sum(axis=(1, 2))
+
+    return {
+        "heights": heights,
+        "aggregate_height": heights.sum(axis=1),
+        "holes": holes,
+        "bumpiness": np.abs(np.diff(heights, axis=1)).sum(axis=1)
+    }
+
+# Lock, clear and extract features for a batch of candidate placements
+def evaluate_batch(boards, pieces, positions, piece_set=piece_sets["tetrominoes"]):
+    shapes, ids = stack_pieces(pieces, piece_set)
+    boards = add_to_grid_batch(boards, shapes, ids, positions)
+    boards, cleared_lines = clear_lines_batch(boards)
+    features = board_features_batch(boards)
+    features["lines_cleared"] = cleared_lines
+    return boards, features
+
+# Score every placement of a move list on one board in a single call. Each
+# placement is (tetromino key, rotation state, position).
+def score_placements(grid, placements, weights=default_weights, piece_set=piece_sets["tetrominoes"]):
+    if not placements:
+        return np.zeros(0)
+    boards = np.broadcast_to(grid, (len(placements),) + grid.shape)
+    pieces = [(key, state) for key, state, _ in placements]
+    positions = [position for _, _, position in placements]
+    _, features = evaluate_batch(boards, pieces, positions, piece_set)
+    return sum(weight * features[name] for name, weight in weights.items())
@@ -0,0 +1,193 @@
+'''
+Benchmarks for the game primitives, with regression tracking.
+
+Micro-benchmarks time the grid helpers on a fixed corpus of boards taken from
+seeded games. Macro-benchmarks time whole headless games (pieces per second)
+and the renderer (frames per second, skipped when pygame is not installed).
+Results are written as JSON, and when a baseline file exists every benchmark
+is compared against it; the run fails if any of them got slower by more than
+the threshold.
+
+    python bench.py --save-baseline           # record the baseline
+    python bench.py --threshold 0.2           # compare against it
+'''
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from bitboard import BitboardEngine, clear_lines_bits, get_piece_masks, grid_to_rows, is_valid_position_bits
+from engine import (TetrisEngine, add_to_grid, apply_wall_kick, calculate_shadow_position, clear_lines, grid_height,
+                    grid_width, is_valid_position, new_statistics, orientations, place_cells, remove_cells,
+                    rotate_tetromino)
+from placements import find_placements
+from runner import play_game
+
+# Build a fixed corpus of boards by playing seeded games and keeping snapshots
+def board_corpus(games=4, pieces=60, every=5):
+    boards = []
+    for seed in range(games):
+        engine = BitboardEngine(seed)
+        for piece in range(pieces):
+            if engine.game_over:
+                break
+            if piece % every == 0:
+                boards.append(engine.grid.copy())
+            state, position, path = max(engine.placements(), key=lambda placement: placement[1][0])
+            engine.apply_path(path)
+    return boards
+
+# Build a board with the given number of full rows at the bottom
+def board_with_full_rows(count):
+    grid = np.zeros((grid_height, grid_width), dtype=int)
+    grid[grid_height - 4:, :grid_width - 1] = 1
+    grid[grid_height - count:, grid_width - 1] = 1
+    return grid
+
+# Time calls of func over a list of argument tuples, returning the best seconds per call.
+# Short lists are repeated so every run lasts long enough to be measured reliably.
+def time_calls(func, calls, repeat, min_calls=1000):
+    calls = calls * -(-min_calls // len(calls))
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for args in calls:
+            func(*args)
+        best = min(best, (time.perf_counter() - start_time) / len(calls))
+    return best
+
+def micro_benchmarks(corpus, repeat):
+    results = {}
+    shape = orientations["T"]["0"]["shape"]
+    masks = get_piece_masks(shape)
+    spawn = (0, grid_width // 2 - 2)
+    positions = [(y, x) for y in range(0, grid_height, 4) for x in range(-1, grid_width - 1, 2)]
+
+    calls = [(shape, grid, position) for grid in corpus for position in positions]
+    results["is_valid_position"] = time_calls(is_valid_position, calls, repeat)
+    rows = [grid_to_rows(grid) for grid in corpus]
+    bit_calls = [(masks, board, position) for board in rows for position in positions]
+    results["is_valid_position_bits"] = time_calls(is_valid_position_bits, bit_calls, repeat)
+
+    # clear_lines works in place, so each call gets its own copy (included in the time)
+    statistics = new_statistics()
+    for count in range(5):
+        grid = board_with_full_rows(count)
+        results[f"clear_lines[{count}]"] = time_calls(lambda: clear_lines(grid.copy(), statistics), [()], repeat)
+        board = grid_to_rows(grid)
+        results[f"clear_lines_bits[{count}]"] = time_calls(lambda: clear_lines_bits(list(board), statistics), [()], repeat)
+
+    calls = [(shape, "T", grid, calculate_shadow_position(shape, grid, spawn)) for grid in corpus]
+    results["add_to_grid"] = time_calls(add_to_grid, calls, repeat)
+
+    # place_cells works in place, so each call removes the piece again (included in the time)
+    cells = orientations["T"]["0"]["cells"]
+    calls = [(grid.copy(), calculate_shadow_position(shape, grid, spawn)) for grid in corpus]
+    results["place_cells"] = time_calls(lambda grid, position: (place_cells(cells, 3, grid, position),
+                                                                remove_cells(cells, grid, position)), calls, repeat)
+
+    calls = [(orientations[key][state]["shape"], direction) for key in orientations for state in orientations[key]
+             for direction in ("clockwise", "counter-clockwise")]
+    results["rotate_tetromino"] = time_calls(rotate_tetromino, calls, repeat)
+
+    rotated = orientations["T"]["R"]["shape"]
+    calls = [(rotated, "T", "clockwise", "0->R", grid, position) for grid in corpus for position in positions]
+    results["apply_wall_kick"] = time_calls(apply_wall_kick, calls, repeat)
+
+    calls = [(shape, grid, spawn) for grid in corpus]
+    results["calculate_shadow_position"] = time_calls(calculate_shadow_position, calls, repeat)
+
+    calls = [(key, grid) for grid in corpus for key in ("I", "T", "S")]
+    results["find_placements"] = time_calls(find_placements, calls, repeat)
+    return results
+
+# Play fixed-seed headless games, returning seconds per piece
+def headless_benchmark(games, pieces):
+    start_time = time.perf_counter()
+    played = sum(play_game(seed, max_pieces=pieces)["pieces"] for seed in range(games))
+    return (time.perf_counter() - start_time) / played
+
+# Render frames of the corpus boards with a moving piece, returning seconds per frame
+def render_benchmark(corpus, frames):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    try:
+        import pygame
+    except ImportError:
+        return None
+    from renderer import Renderer
+
+    pygame.init()
+    window = pygame.display.set_mode((600, 900))
+    renderer = Renderer(window, pygame.font.Font(None, 24))
+    engine = TetrisEngine(0)
+    start_time = time.perf_counter()
+    for frame in range(frames):
+        if frame % 20 == 0:
+            engine.grid = corpus[frame // 20 % len(corpus)]
+        engine.current_position = (0, frame % (grid_width - 3))
+        renderer.draw(engine, 0.0)
+    elapsed_time = time.perf_counter() - start_time
+    pygame.quit()
+    return elapsed_time / frames
+
+# Compare results with a baseline, returning the benchmarks slower than the threshold
+def find_regressions(results, baseline, threshold):
+    regressions = {}
+    for name, seconds in results.items():
+        old = baseline.get(name)
+        if old and seconds is not None and seconds > old * (1 + threshold):
+            regressions[name] = seconds / old - 1
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the game primitives and check for regressions.")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the results")
+    parser.add_argument("--baseline", default="bench_baseline.json", help="results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per micro-benchmark, the best is kept")
+    parser.add_argument("--games", type=int, default=3)
+    parser.add_argument("--pieces", type=int, default=200)
+    parser.add_argument("--frames", type=int, default=500)
+    args = parser.parse_args()
+
+    corpus = board_corpus()
+    results = micro_benchmarks(corpus, args.repeat)
+    results["headless_piece"] = headless_benchmark(args.games, args.pieces)
+    results["rendered_frame"] = render_benchmark(corpus, args.frames)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seconds_per_call": results,
+        "pieces_per_second": 1 / results["headless_piece"],
+        "frames_per_second": 1 / results["rendered_frame"] if results["rendered_frame"] else None
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    for name, seconds in results.items():
+        print(f"{name:32} {'skipped' if seconds is None else f'{seconds * 1e6:10.2f} us'}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            regressions = find_regressions(results, json.load(file), args.threshold)
+        for name, slowdown in regressions.items():
+            print(f"REGRESSION {name}: {slowdown:.0%} slower than baseline")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.threshold:.0%}")
+
+if __name__ == "__main__":
+    main()
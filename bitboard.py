@@ -0,0 +1,131 @@
+'''
+Bitboard versions of the grid helpers in engine.py.
+
+Each row of the grid is stored as an integer whose bit j is set when column j
+is filled, so a collision test is a handful of ANDs and a full row is a single
+equality check against full_row. The functions here mirror is_valid_position,
+add_to_grid, clear_lines and calculate_shadow_position and give the same
+results on the same board.
+'''
+
+import numpy as np
+
+from engine import TetrisEngine, compact_rows, count_line_clear, grid_width, grid_height, place_cells, statistics
+
+# Define the mask of a completely filled row
+full_row = (1 << grid_width) - 1
+
+# Define a cache of row masks for every shape seen so far
+piece_masks = {}
+
+# Convert a numpy grid into a list of row bitmasks
+def grid_to_rows(grid):
+    width = grid.shape[1]
+    if width < 63:
+        weights = 1 << np.arange(width, dtype=np.int64)
+        return [int(r) for r in (grid != 0) @ weights]
+    # Wider rows do not fit in an int64: pack each row into bytes, highest column first
+    shift = -width % 8
+    return [int.from_bytes(row.tobytes(), "big") >> shift for row in np.packbits(grid[:, ::-1] != 0, axis=1)]
+
+# Convert a list of row bitmasks back into a 0/1 numpy grid
+def rows_to_grid(rows, width=grid_width):
+    grid = np.zeros((len(rows), width), dtype=int)
+    for i, row in enumerate(rows):
+        for j in range(width):
+            if row >> j & 1:
+                grid[i, j] = 1
+    return grid
+
+# Precompute the row masks of a shape for every column it can occupy on a board of the given width
+def get_piece_masks(tetromino, width=grid_width):
+    key = (tetromino.shape, tetromino.tobytes(), width)
+    masks = piece_masks.get(key)
+    if masks is not None:
+        return masks
+
+    cells = np.argwhere(tetromino == 1)
+    top, left = cells.min(axis=0)
+    bottom, right = cells.max(axis=0)
+    base = [(i, sum(1 << j for j in range(tetromino.shape[1]) if tetromino[i, j] == 1)) for i in range(top, bottom + 1)]
+    shifted = {}
+    for x in range(-left, width - right):
+        shifted[x] = tuple((i, m << x if x >= 0 else m >> -x) for i, m in base)
+
+    masks = {"rows": shifted, "top": int(top), "bottom": int(bottom)}
+    piece_masks[key] = masks
+    return masks
+
+def is_valid_position_bits(masks, rows, position):
+    y, x = position
+    shifted = masks["rows"].get(x)
+    if shifted is None or y + masks["top"] < 0 or y + masks["bottom"] >= len(rows):
+        return False
+    for i, m in shifted:
+        if rows[y + i] & m:
+            return False
+    return True
+
+def add_to_rows(masks, rows, position):
+    y, x = position
+    for i, m in masks["rows"][x]:
+        rows[y + i] |= m
+    return rows
+
+# Define a function to check for full lines and clear them
+def clear_lines_bits(rows, statistics=statistics, full=full_row):
+    kept = [row for row in rows if row != full]
+    cleared_lines = len(rows) - len(kept)
+    if cleared_lines:
+        rows[:] = [0] * cleared_lines + kept
+
+    # Update statistics
+    if cleared_lines:
+        count_line_clear(statistics, cleared_lines)
+
+    return rows, cleared_lines
+
+def calculate_shadow_position_bits(masks, rows, position):
+    y, x = position
+    while is_valid_position_bits(masks, rows, (y + 1, x)):
+        y += 1
+    return (y, x)
+
+# Define a TetrisEngine that keeps a bitboard next to the grid for collisions
+class BitboardEngine(TetrisEngine):
+    def __init__(self, seed=None, width=grid_width, height=grid_height, piece_set="tetrominoes"):
+        self.rows = [0] * height
+        self.full_row = (1 << width) - 1
+        super().__init__(seed, width, height, piece_set)
+
+    def fits(self, tetromino, position):
+        return is_valid_position_bits(get_piece_masks(tetromino, self.width), self.rows, position)
+
+    def shadow_position(self):
+        return calculate_shadow_position_bits(get_piece_masks(self.current_tetromino, self.width), self.rows, self.current_position)
+
+    def placements(self):
+        from placements import find_placements
+        return find_placements(self.current_tetromino_key, position=self.current_position, rotation_state=self.rotation_state,
+                               rows=self.rows, width=self.width, piece_set=self.piece_set)
+
+    def place(self):
+        add_to_rows(get_piece_masks(self.current_tetromino, self.width), self.rows, self.current_position)
+        cells = self.orientations[self.current_tetromino_key][self.rotation_state]["cells"]
+        place_cells(cells, self.pieces[self.current_tetromino_key]['ID'], self.grid, self.current_position)
+        full_rows = self.features.add_cells(self.grid, self.current_cells())
+        self.rows, cleared_lines = clear_lines_bits(self.rows, self.statistics, self.full_row)
+        # Keep the colored grid in step with the bitboard for rendering
+        compact_rows(self.grid, full_rows)
+        self.features.clear_rows(self.grid, full_rows)
+        self.update_hash(cells, cleared_lines)
+        return cleared_lines
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot["rows"] = list(self.rows)
+        return snapshot
+
+    def restore(self, snapshot):
+        super().restore(snapshot)
+        self.rows[:] = snapshot["rows"]
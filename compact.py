@@ -0,0 +1,219 @@
+'''
+Compact game state for large populations of games.
+
+TetrisEngine is convenient but heavy: a NumPy grid, tuples, strings and
+nested statistics dicts for every game. Here a game is a handful of small
+ints: the board is one 16-bit row mask per row (as in bitboard.py), pieces
+are indexes into piece_keys, the rotation an index into rotation_states and
+the 7-bag a bitmask of the pieces left in it. Each game draws its pieces
+from its own xorshift generator, whose state is a single 64-bit int.
+
+CompactGame holds one such game in __slots__ and plays it a placement at a
+time (hold, or drop the piece straight down in a given rotation and column).
+GamePopulation stores many games as one NumPy array per field, around a
+hundred bytes per game, and plays them through CompactGame.
+'''
+
+from array import array
+
+import numpy as np
+
+from bitboard import calculate_shadow_position_bits, full_row, get_piece_masks, is_valid_position_bits
+from engine import grid_height, grid_width, orientations, tetrominoes
+
+# Define the piece and rotation indexes (a piece index is its tetromino ID - 1)
+piece_keys = tuple(sorted(tetrominoes, key=lambda key: tetrominoes[key]['ID']))
+rotation_states = ("0", "R", "2", "L")
+no_piece = len(piece_keys)
+full_bag = (1 << len(piece_keys)) - 1
+spawn_position = (0, grid_width // 2 - 2)
+
+# Define the row masks of every orientation, indexed by [piece][rotation]
+orientation_masks = [[get_piece_masks(orientations[key][state]["shape"]) for state in rotation_states] for key in piece_keys]
+
+# Define the layout of the statistics counters: pieces drawn per type, then line clears by size
+line_clear_offset = len(piece_keys)
+counter_count = line_clear_offset + 4
+
+mask64 = (1 << 64) - 1
+
+# Turn a seed into a non-zero xorshift state
+def seed_state(seed):
+    state = (seed + 0x9E3779B97F4A7C15) & mask64
+    state = (state ^ (state >> 30)) * 0xBF58476D1CE4E5B9 & mask64
+    state = (state ^ (state >> 27)) * 0x94D049BB133111EB & mask64
+    return (state ^ (state >> 31)) or 1
+
+# Advance a xorshift64* state, returning the new state and a random number
+def next_random(state):
+    state ^= state >> 12
+    state ^= (state << 25) & mask64
+    state ^= state >> 27
+    return state, (state * 0x2545F4914F6CDD1D & mask64) >> 32
+
+# Draw a piece from a bag bitmask, refilling it when empty; returns (piece, bag, state)
+def draw_from_bag(bag, state):
+    if not bag:
+        bag = full_bag
+    state, number = next_random(state)
+    choice = number % bin(bag).count("1")
+    for piece in range(len(piece_keys)):
+        if bag >> piece & 1:
+            if not choice:
+                return piece, bag & ~(1 << piece), state
+            choice -= 1
+
+# Define one game as a few small ints
+class CompactGame:
+    __slots__ = ("rows", "piece", "rotation", "position", "next_piece", "hold_piece", "hold_used",
+                 "bag", "rng", "score", "game_over", "counters")
+
+    def __init__(self, seed=0):
+        self.rows = array("H", bytes(2 * grid_height))
+        self.counters = array("I", bytes(4 * counter_count))
+        self.bag = 0
+        self.rng = seed_state(seed)
+        self.score = 0
+        self.game_over = False
+        self.hold_piece = no_piece
+        self.hold_used = False
+        self.next_piece = self.draw()
+        self.spawn()
+
+    def draw(self):
+        piece, self.bag, self.rng = draw_from_bag(self.bag, self.rng)
+        self.counters[piece] += 1
+        return piece
+
+    # Take the next piece (or the given one) and place it at the top
+    def spawn(self, piece=None):
+        if piece is None:
+            piece = self.next_piece
+            self.next_piece = self.draw()
+        self.piece = piece
+        self.rotation = 0
+        self.position = spawn_position
+        if not is_valid_position_bits(orientation_masks[piece][0], self.rows, spawn_position):
+            self.game_over = True
+
+    def hold(self):
+        if self.game_over or self.hold_used:
+            return False
+        if self.hold_piece == no_piece:
+            self.hold_piece = self.piece
+            self.spawn()
+        else:
+            self.hold_piece, piece = self.piece, self.hold_piece
+            self.spawn(piece)
+        self.hold_used = True
+        return True
+
+    # Drop the current piece straight down in the given rotation and column,
+    # then clear lines and spawn the next one. Returns the number of cleared
+    # lines, or None if the piece does not fit there at the top.
+    def drop(self, rotation, x):
+        if self.game_over:
+            return None
+        masks = orientation_masks[self.piece][rotation]
+        if not is_valid_position_bits(masks, self.rows, (0, x)):
+            return None
+        y, _ = calculate_shadow_position_bits(masks, self.rows, (0, x))
+        rows = self.rows
+        for i, m in masks["rows"][x]:
+            rows[y + i] |= m
+
+        kept = [row for row in rows if row != full_row]
+        cleared_lines = grid_height - len(kept)
+        if cleared_lines:
+            rows[:] = array("H", [0] * cleared_lines + kept)
+            self.counters[line_clear_offset + cleared_lines - 1] += 1
+
+        self.score += cleared_lines
+        self.hold_used = False
+        self.spawn()
+        return cleared_lines
+
+    # Expand the board into a 0/1 NumPy grid, for the feature and rendering code
+    def grid(self):
+        bits = np.array(self.rows, dtype=np.uint16)[:, None] >> np.arange(grid_width, dtype=np.uint16)
+        return (bits & 1).astype(int)
+
+# Define many games stored field by field in contiguous arrays
+class GamePopulation:
+    fields = {
+        "rows": (np.uint16, (grid_height,)),
+        "piece": (np.uint8, ()),
+        "rotation": (np.uint8, ()),
+        "y": (np.int8, ()),
+        "x": (np.int8, ()),
+        "next_piece": (np.uint8, ()),
+        "hold_piece": (np.uint8, ()),
+        "hold_used": (np.bool_, ()),
+        "bag": (np.uint8, ()),
+        "rng": (np.uint64, ()),
+        "score": (np.uint32, ()),
+        "game_over": (np.bool_, ()),
+        "counters": (np.uint32, (counter_count,))
+    }
+
+    def __init__(self, count, seed=0):
+        self.count = count
+        for name, (dtype, shape) in self.fields.items():
+            setattr(self, name, np.zeros((count,) + shape, dtype=dtype))
+        for i in range(count):
+            self.put(i, CompactGame(seed + i))
+
+    # Total memory used by the arrays, in bytes
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.fields)
+
+    # Copy game i out of the arrays
+    def get(self, i):
+        game = CompactGame.__new__(CompactGame)
+        game.rows = array("H", self.rows[i].tobytes())
+        game.counters = array("I", self.counters[i].tobytes())
+        game.piece = int(self.piece[i])
+        game.rotation = int(self.rotation[i])
+        game.position = (int(self.y[i]), int(self.x[i]))
+        game.next_piece = int(self.next_piece[i])
+        game.hold_piece = int(self.hold_piece[i])
+        game.hold_used = bool(self.hold_used[i])
+        game.bag = int(self.bag[i])
+        game.rng = int(self.rng[i])
+        game.score = int(self.score[i])
+        game.game_over = bool(self.game_over[i])
+        return game
+
+    # Write a game into slot i
+    def put(self, i, game):
+        self.rows[i] = game.rows
+        self.counters[i] = game.counters
+        self.piece[i] = game.piece
+        self.rotation[i] = game.rotation
+        self.y[i], self.x[i] = game.position
+        self.next_piece[i] = game.next_piece
+        self.hold_piece[i] = game.hold_piece
+        self.hold_used[i] = game.hold_used
+        self.bag[i] = game.bag
+        self.rng[i] = game.rng
+        self.score[i] = game.score
+        self.game_over[i] = game.game_over
+
+    # Drop the current piece of game i (see CompactGame.drop)
+    def drop(self, i, rotation, x):
+        game = self.get(i)
+        cleared_lines = game.drop(rotation, x)
+        if cleared_lines is not None:
+            self.put(i, game)
+        return cleared_lines
+
+    def hold(self, i):
+        game = self.get(i)
+        if not game.hold():
+            return False
+        self.put(i, game)
+        return True
+
+    # Indexes of the games still running
+    def alive(self):
+        return np.flatnonzero(~self.game_over)
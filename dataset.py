@@ -0,0 +1,194 @@
+'''
+Generate (board, piece, placement) training samples into memory-mapped files.
+
+Headless games are played on a process pool as in runner.py. Each game
+comes back as one NumPy structured array with a row per placed piece: the
+board before the piece, the current/next/hold pieces, the chosen placement
+and its outcome (lines it cleared, the final score and how many pieces the
+game lasted after it). The rows are copied into preallocated .npy chunks
+opened as memory maps, so nothing is pickled per sample.
+
+A dataset is a directory of chunk_NNNNN.npy files plus manifest.json, which
+records how many rows of each chunk are valid. The manifest is replaced
+atomically after the chunks are flushed, so a reader opening the dataset
+while it is being written sees only complete samples, and a writer opened
+on an existing dataset appends after its last row.
+
+    python dataset.py data/ --games 10000 --workers 8 --seed 0
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+from functools import partial
+
+import numpy as np
+
+from bitboard import BitboardEngine
+from engine import grid_height, grid_width, tetrominoes
+from runner import policies
+
+# Define the layout of one sample. Pieces are tetromino IDs, 0 for none;
+# states index rotation_states.
+sample_dtype = np.dtype([
+    ("board", np.uint8, (grid_height, grid_width)),
+    ("piece", np.uint8),
+    ("next", np.uint8),
+    ("hold", np.uint8),
+    ("used_hold", np.bool_),
+    ("placed", np.uint8),
+    ("state", np.uint8),
+    ("y", np.int8),
+    ("x", np.int8),
+    ("lines", np.uint8),
+    ("score", np.uint32),
+    ("final_score", np.uint32),
+    ("pieces_left", np.uint32),
+    ("seed", np.uint64)
+])
+rotation_states = ("0", "R", "2", "L")
+manifest_version = 1
+
+# Convert a tetromino key (or None) to the code stored in samples
+def piece_id(key):
+    return 0 if key is None else tetrominoes[key]['ID']
+
+# Play one game and return its samples as a structured array
+def game_samples(seed, policy="greedy", max_pieces=None):
+    engine = BitboardEngine(seed)
+    choose = policies[policy]
+    rows = []
+    while not engine.game_over and (max_pieces is None or len(rows) < max_pieces):
+        board = engine.grid.astype(np.uint8)
+        before = (piece_id(engine.current_tetromino_key), piece_id(engine.next_tetromino_key),
+                  piece_id(engine.hold_tetromino_key), engine.score)
+        state, position, path = choose(engine, engine.placements())
+        used_hold = bool(path) and path[0] == "hold"
+        if used_hold:
+            placed = engine.hold_tetromino_key or engine.next_tetromino_key
+        else:
+            placed = engine.current_tetromino_key
+        lines = engine.apply_path(path)
+        rows.append((board,) + before[:3] + (used_hold, piece_id(placed), rotation_states.index(state),
+                                             position[0], position[1], lines, before[3], 0, 0, seed))
+
+    samples = np.array(rows, dtype=sample_dtype)
+    samples["final_score"] = engine.score
+    samples["pieces_left"] = np.arange(len(samples) - 1, -1, -1)
+    return samples
+
+# Read the manifest of a dataset directory, or None if there is none yet
+def read_manifest(path):
+    manifest_path = os.path.join(path, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as file:
+        return json.load(file)
+
+# Define a writer that appends samples to the chunks of a dataset directory
+class DatasetWriter:
+    def __init__(self, path, chunk_size=65536):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.manifest = read_manifest(path)
+        descr = np.lib.format.dtype_to_descr(sample_dtype)
+        if self.manifest is None:
+            self.manifest = {"version": manifest_version, "chunk_size": chunk_size, "dtype": descr, "chunks": []}
+        elif self.manifest["version"] != manifest_version or self.manifest["dtype"] != json.loads(json.dumps(descr)):
+            raise ValueError(f"{path} holds samples of a different layout")
+        self.chunk_size = self.manifest["chunk_size"]
+        self.chunk = None
+        if self.manifest["chunks"] and self.manifest["chunks"][-1]["count"] < self.chunk_size:
+            self.open_chunk(self.manifest["chunks"][-1], "r+")
+
+    def open_chunk(self, entry, mode):
+        self.entry = entry
+        self.chunk = np.lib.format.open_memmap(os.path.join(self.path, entry["file"]), mode=mode,
+                                               dtype=sample_dtype, shape=(self.chunk_size,))
+
+    # Start a new preallocated chunk
+    def new_chunk(self):
+        if self.chunk is not None:
+            self.chunk.flush()
+        entry = {"file": f"chunk_{len(self.manifest['chunks']):05d}.npy", "count": 0}
+        self.manifest["chunks"].append(entry)
+        self.open_chunk(entry, "w+")
+
+    # Copy an array of samples into the chunks, starting new ones as they fill up
+    def append(self, samples):
+        start = 0
+        while start < len(samples):
+            if self.chunk is None or self.entry["count"] == self.chunk_size:
+                self.new_chunk()
+            count = self.entry["count"]
+            taken = min(len(samples) - start, self.chunk_size - count)
+            self.chunk[count:count + taken] = samples[start:start + taken]
+            self.entry["count"] += taken
+            start += taken
+
+    # Make the rows written so far visible to readers
+    def flush(self):
+        if self.chunk is not None:
+            self.chunk.flush()
+        manifest_path = os.path.join(self.path, "manifest.json")
+        with open(manifest_path + ".tmp", "w") as file:
+            json.dump(self.manifest, file, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def close(self):
+        self.flush()
+        self.chunk = None
+
+    def __len__(self):
+        return sum(entry["count"] for entry in self.manifest["chunks"])
+
+# Open the valid rows of every chunk of a dataset as read-only memory maps (no copy)
+def open_dataset(path):
+    manifest = read_manifest(path)
+    if manifest is None:
+        return []
+    return [np.load(os.path.join(path, entry["file"]), mmap_mode="r")[:entry["count"]]
+            for entry in manifest["chunks"] if entry["count"]]
+
+# Play every seed on a pool of worker processes and append the samples to a
+# dataset, returning how many samples were added and how many it now holds
+def generate(path, seeds, workers=None, policy="greedy", max_pieces=None, chunk_size=65536, flush_interval=1.0):
+    writer = DatasetWriter(path, chunk_size)
+    game = partial(game_samples, policy=policy, max_pieces=max_pieces)
+    appended = 0
+    last_flush = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        for samples in pool.imap_unordered(game, seeds, chunksize=1):
+            writer.append(samples)
+            appended += len(samples)
+            if time.perf_counter() - last_flush >= flush_interval:
+                writer.flush()
+                last_flush = time.perf_counter()
+    writer.close()
+    return appended, len(writer)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate placement samples from headless games.")
+    parser.add_argument("path", help="dataset directory, created or appended to")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of CPUs")
+    parser.add_argument("--seed", type=int, default=None, help="seed used to draw one seed per game")
+    parser.add_argument("--policy", choices=sorted(policies), default="greedy")
+    parser.add_argument("--max-pieces", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=65536, help="samples per chunk file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    seeds = [rng.getrandbits(32) for _ in range(args.games)]
+
+    start_time = time.perf_counter()
+    appended, total = generate(args.path, seeds, args.workers, args.policy, args.max_pieces, args.chunk_size)
+    elapsed_time = time.perf_counter() - start_time
+    print(json.dumps({"path": args.path, "games": len(seeds), "samples": appended, "total_samples": total,
+                      "samples_per_second": appended / elapsed_time if elapsed_time > 0 else 0}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,556 @@
+'''
+Headless Tetris game logic.
+
+Nothing in here touches pygame, so bots, batch runners and analysis scripts can
+import it without opening a window. main.py draws on top of TetrisEngine.
+'''
+
+import copy
+import numpy as np
+import random
+
+from features import BoardFeatures
+from transposition import grid_hash, toggle_cells
+
+# Define the names of line clears by the number of lines
+line_clear_names = ("single", "double", "triple", "quadruple", "quintuple", "sextuple", "septuple", "octuple")
+
+# Name a clear of the given number of lines, past the named ones as "9_lines" and so on
+def line_clear_name(cleared_lines):
+    if cleared_lines <= len(line_clear_names):
+        return line_clear_names[cleared_lines - 1]
+    return f"{cleared_lines}_lines"
+
+# Define a dictionary to keep track of the statistics:
+def new_statistics(piece_keys=("I", "O", "T", "S", "Z", "J", "L"), max_lines=4):
+    return {
+        "total_tetrominoes": 0,
+        "tetromino_counts": {key: 0 for key in piece_keys},
+        "line_clears": {line_clear_name(n): 0 for n in range(1, max_lines + 1)}
+    }
+
+statistics = new_statistics()
+
+# Add the counts of one statistics dictionary into another
+def merge_statistics(total, other):
+    total["total_tetrominoes"] += other["total_tetrominoes"]
+    for group in ("tetromino_counts", "line_clears"):
+        for name, count in other[group].items():
+            total[group][name] = total[group].get(name, 0) + count
+    return total
+
+# Define the tetrominoes as 4x4 matrices, in their SRS spawn orientation (state "0")
+tetrominoes = {
+    "I": {
+        "shape": np.array([
+            [0, 0, 0, 0],
+            [1, 1, 1, 1],
+            [0, 0, 0, 0],
+            [0, 0, 0, 0]
+        ]),
+        "color": "cyan" , 'ID': 1
+    },
+    "O": {
+        "shape": np.array([
+            [0, 1, 1, 0],
+            [0, 1, 1, 0],
+            [0, 0, 0, 0],
+            [0, 0, 0, 0]
+        ]),
+        "color": "yellow", 'ID': 2
+    },
+    "T": {
+        "shape": np.array([
+            [0, 1, 0, 0],
+            [1, 1, 1, 0],
+            [0, 0, 0, 0],
+            [0, 0, 0, 0]
+        ]),
+        "color": "purple", 'ID': 3
+    },
+    "S": {
+        "shape": np.array([
+            [0, 1, 1, 0],
+            [1, 1, 0, 0],
+            [0, 0, 0, 0],
+            [0, 0, 0, 0]
+        ]),
+        "color": "green", 'ID': 4
+    },
+    "Z": {
+        "shape": np.array([
+            [1, 1, 0, 0],
+            [0, 1, 1, 0],
+            [0, 0, 0, 0],
+            [0, 0, 0, 0]
+        ]),
+        "color": "red", 'ID': 5
+    },
+    "J": {
+        "shape": np.array([
+            [1, 0, 0, 0],
+            [1, 1, 1, 0],
+            [0, 0, 0, 0],
+            [0, 0, 0, 0]
+        ]),
+        "color": "blue", 'ID': 6
+    },
+    "L": {
+        "shape": np.array([
+            [0, 0, 1, 0],
+            [1, 1, 1, 0],
+            [0, 0, 0, 0],
+            [0, 0, 0, 0]
+        ]),
+        "color": "orange", 'ID': 7
+    }
+}
+
+# Build a square 0/1 matrix of the given size from rows of "X" (filled) and "." (empty)
+def make_shape(rows, size):
+    shape = np.zeros((size, size), dtype=int)
+    for i, row in enumerate(rows):
+        for j, cell in enumerate(row):
+            shape[i, j] = cell == "X"
+    return shape
+
+# Define the pentominoes as 5x5 matrices, for the variant mode
+pentominoes = {
+    key: {"shape": make_shape(rows, 5), "color": color, 'ID': index + 1}
+    for index, (key, rows, color) in enumerate([
+        ("F", [".XX", "XX.", ".X."], "cyan"),
+        ("I", ["XXXXX"], "yellow"),
+        ("L", ["...X", "XXXX"], "purple"),
+        ("N", ["XX..", ".XXX"], "green"),
+        ("P", ["XX", "XX", "X."], "red"),
+        ("T", ["XXX", ".X.", ".X."], "blue"),
+        ("U", ["X.X", "XXX"], "orange"),
+        ("V", ["X..", "X..", "XXX"], "pink"),
+        ("W", ["X..", "XX.", ".XX"], "lime"),
+        ("X", [".X.", "XXX", ".X."], "teal"),
+        ("Y", ["..X.", "XXXX"], "brown"),
+        ("Z", ["XX.", ".X.", ".XX"], "olive")
+    ])
+}
+
+# Define the game grid as a 10x20 2D list
+grid_width = 10
+grid_height = 20
+
+# Define the wall kick offsets for each tetromino and rotation direction
+wall_kick_offsets = {
+    "I": {
+        "0->R": [(0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)],
+        "R->0": [(0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)],
+        "R->2": [(0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)],
+        "2->R": [(0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)],
+        "2->L": [(0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)],
+        "L->2": [(0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)],
+        "L->0": [(0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)],
+        "0->L": [(0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)]
+    },
+    "others": {
+        "0->R": [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
+        "R->0": [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
+        "R->2": [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
+        "2->R": [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
+        "2->L": [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
+        "L->2": [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
+        "L->0": [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
+        "0->L": [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)]
+    }
+}
+
+# Define the rotation state reached by turning each way from every state
+next_rotation_state = {
+    "clockwise": {"0": "R", "R": "2", "2": "L", "L": "0"},
+    "counter-clockwise": {"0": "L", "L": "2", "2": "R", "R": "0"}
+}
+
+# Convert the SRS (x, y-up) kick offsets of a rotation into (row, column) steps
+def kick_steps(tetromino_key, rotation_key):
+    offsets = wall_kick_offsets["I" if tetromino_key == "I" else "others"][rotation_key]
+    return tuple((-dy, dx) for dx, dy in offsets)
+
+# Find the SRS box a piece turns in: the smallest square covering its spawn
+# orientation, anchored at the top row and at the piece's leftmost column
+def rotation_box(tetromino):
+    cells = np.argwhere(tetromino == 1)
+    left = cells[:, 1].min()
+    size = max(cells[:, 0].max() + 1, cells[:, 1].max() - left + 1)
+    return left, size
+
+# Turn a shape a quarter turn inside its SRS box
+def rotate_tetromino(tetromino, direction, box=None):
+    if box is None:
+        # Orientations from the table are looked up instead of rotated
+        found = orientation_of.get(tetromino.tobytes())
+        if found is not None:
+            key, state = found
+            new_state = orientations[key][state]["rotations"][direction][0]
+            return orientations[key][new_state]["shape"]
+        box = rotation_box(tetromino)
+    left, size = box
+    rotated = np.zeros_like(tetromino)
+
+    # Rotate clockwise or counter-clockwise inside the box
+    square = tetromino[0:size, left:left + size]
+    rotated[0:size, left:left + size] = np.rot90(square, -1 if direction == "clockwise" else 1)
+    return rotated
+
+# Build the table of every orientation of every tetromino, with its cells,
+# bounding box and the SRS kicks to try when turning from it
+def build_orientations(tetrominoes):
+    table = {}
+    for key, tetromino in tetrominoes.items():
+        # Freeze a copy, leaving the caller's piece definitions writable
+        shape = tetromino["shape"].copy()
+        box = rotation_box(shape)
+        table[key] = {}
+        for state in ("0", "R", "2", "L"):
+            cells = tuple((int(i), int(j)) for i, j in np.argwhere(shape == 1))
+            rows = [i for i, _ in cells]
+            cols = [j for _, j in cells]
+            shape.setflags(write=False)
+            rotations = {}
+            for direction in ("clockwise", "counter-clockwise"):
+                new_state = next_rotation_state[direction][state]
+                rotations[direction] = (new_state, kick_steps(key, f"{state}->{new_state}"))
+            table[key][state] = {
+                "shape": shape,
+                "cells": cells,
+                "bbox": (min(rows), min(cols), max(rows), max(cols)),
+                "rotations": rotations
+            }
+            shape = rotate_tetromino(shape, "clockwise", box)
+    return table
+
+# Define a function to check for full lines and clear them
+# (rows, when given, lists the only rows that can be full, top to bottom)
+def clear_lines(grid, statistics=statistics, rows=None):
+    if rows is None:
+        full_rows = np.flatnonzero(grid.all(axis=1)).tolist()
+    else:
+        full_rows = [i for i in rows if grid[i].all()]
+    compact_rows(grid, full_rows)
+    cleared_lines = len(full_rows)
+
+    # Update statistics
+    if cleared_lines:
+        count_line_clear(statistics, cleared_lines)
+
+    return grid, cleared_lines
+
+# Count a clear of the given number of lines in the statistics
+def count_line_clear(statistics, cleared_lines):
+    name = line_clear_name(cleared_lines)
+    if name in statistics["line_clears"]:
+        statistics["line_clears"][name] += 1
+
+# Remove the given full rows (top to bottom) from the grid in place. The
+# blocks of rows between them are each moved down once, bottom block first,
+# by the number of full rows below them.
+def compact_rows(grid, full_rows):
+    count = len(full_rows)
+    if not count:
+        return grid
+    edges = [-1] + list(full_rows)
+    for m in range(count, 0, -1):
+        top, bottom, shift = edges[m - 1] + 1, edges[m], count - m + 1
+        if top < bottom:
+            grid[top + shift:bottom + shift] = grid[top:bottom]
+    grid[:count] = 0
+    return grid
+
+# Define a function to add the current tetromino to the game grid
+def add_to_grid(tetromino, current_tetromino_key, grid, position, pieces=tetrominoes):
+    new_grid = grid.copy()
+    tetromino_id = pieces[current_tetromino_key]['ID']
+    for i, j in np.argwhere(tetromino == 1):
+        new_grid[position[0] + i, position[1] + j] = tetromino_id
+    return new_grid
+
+# Write the cells of an orientation (see orientations) into the grid in
+# place. Nothing is allocated, so a search can place and remove pieces
+# millions of times on a single board.
+def place_cells(cells, tetromino_id, grid, position):
+    y, x = position
+    for i, j in cells:
+        grid[y + i, x + j] = tetromino_id
+
+# Erase cells written by place_cells, when no lines were cleared in between
+def remove_cells(cells, grid, position):
+    place_cells(cells, 0, grid, position)
+
+def apply_wall_kick(tetromino, current_tetromino_key, direction, rotation_key, grid, position):
+    for step in kick_steps(current_tetromino_key, rotation_key):
+        new_position = (position[0] + step[0], position[1] + step[1])
+
+        # Check if the new position is valid (this also covers the grid boundaries)
+        if is_valid_position(tetromino, grid, new_position):
+            return new_position
+    return None
+
+# Define a cache of the filled cells of every shape seen so far
+shape_cells_cache = {}
+
+# Get the filled (row, column) cells of a shape of any size
+def shape_cells(tetromino):
+    key = (tetromino.shape, tetromino.tobytes())
+    cells = shape_cells_cache.get(key)
+    if cells is None:
+        cells = shape_cells_cache[key] = tuple((int(i), int(j)) for i, j in np.argwhere(tetromino == 1))
+    return cells
+
+# Check the filled cells only, so the cost does not grow with the size of the matrix
+def is_valid_position(tetromino, grid, position):
+    height, width = grid.shape
+    y, x = position
+    for i, j in shape_cells(tetromino):
+        if not (0 <= y + i < height and 0 <= x + j < width) or grid[y + i, x + j] != 0:
+            return False
+    return True
+
+def calculate_shadow_position(tetromino, grid, position):
+    shadow_position = position
+    while is_valid_position(tetromino, grid, (shadow_position[0] + 1, shadow_position[1])):
+        shadow_position = (shadow_position[0] + 1, shadow_position[1])
+    return shadow_position
+
+# Define every orientation of every tetromino once, so rotating is a lookup
+orientation_of = {}
+orientations = build_orientations(tetrominoes)
+for key in orientations:
+    for state in orientations[key]:
+        orientation_of.setdefault(orientations[key][state]["shape"].tobytes(), (key, state))
+
+# Build a piece set: its pieces, their orientation table, the keys a bag is
+# filled with and the size of the largest piece matrix
+def make_piece_set(pieces, table=None):
+    return {
+        "pieces": pieces,
+        "orientations": table if table is not None else build_orientations(pieces),
+        "keys": tuple(pieces),
+        "size": max(piece["shape"].shape[1] for piece in pieces.values())
+    }
+
+# Define the piece sets a game can be played with
+piece_sets = {
+    "tetrominoes": make_piece_set(tetrominoes, orientations),
+    "pentominoes": make_piece_set(pentominoes)
+}
+
+def get_tetromino_from_bag(bag, statistics=statistics, rng=random, keys=('I', 'O', 'T', 'S', 'Z', 'J', 'L')):
+    if not bag:
+        # Refill the bag with one of each piece (all seven tetrominoes by default)
+        bag.extend(keys)
+    # Draw a random tetromino from the bag
+    tetromino = rng.choice(bag)
+    bag.remove(tetromino)
+    # Update statistics
+    statistics["total_tetrominoes"] += 1
+    statistics["tetromino_counts"][tetromino] += 1
+
+    return tetromino
+
+# Define the inputs a player can give, and how the movement ones shift the piece
+inputs = ("left", "right", "down", "clockwise", "counter-clockwise", "hold", "hard_drop", "step")
+shifts = {"left": (0, -1), "right": (0, 1), "down": (1, 0)}
+
+# Define the game state and the actions a player (or a bot) can take on it
+class TetrisEngine:
+    def __init__(self, seed=None, width=grid_width, height=grid_height, piece_set="tetrominoes"):
+        # Each game draws its pieces from its own generator, so a seed replays it exactly
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        # Define the board size and the pieces (a name from piece_sets or a set from make_piece_set)
+        self.width = width
+        self.height = height
+        self.piece_set = piece_sets[piece_set] if isinstance(piece_set, str) else piece_set
+        self.pieces = self.piece_set["pieces"]
+        self.orientations = self.piece_set["orientations"]
+
+        self.grid = np.zeros((height, width), dtype=int)
+        self.features = BoardFeatures(self.grid)
+        self.board_hash = grid_hash(self.grid)
+        self.statistics = new_statistics(self.piece_set["keys"], self.piece_set["size"])
+        self.bag = []
+        self.score = 0
+        self.game_over = False
+
+        # Define the listener called as on_event(kind, fields) at spawn, hold, lock, clear and game over
+        self.on_event = None
+
+        # Define the next tetromino, the hold slot and the first falling piece
+        self.next_tetromino_key = get_tetromino_from_bag(self.bag, self.statistics, self.rng, self.piece_set["keys"])
+        self.hold_tetromino_key = None
+        self.hold_used = False
+        self.spawn()
+
+    # Take the next tetromino from the preview and place it at the top
+    def spawn(self, key=None):
+        if key is None:
+            key = self.next_tetromino_key
+            self.next_tetromino_key = get_tetromino_from_bag(self.bag, self.statistics, self.rng, self.piece_set["keys"])
+        self.current_tetromino_key = key
+        self.current_tetromino = self.orientations[key]["0"]["shape"]
+        self.current_position = (0, (self.width - self.current_tetromino.shape[1]) // 2)
+        self.rotation_state = "0"
+        if not self.fits(self.current_tetromino, self.current_position):
+            self.game_over = True  # Game over
+        if self.on_event is not None:
+            self.on_event("game_over" if self.game_over else "spawn", {"piece": key, "next": self.next_tetromino_key})
+
+    # Check whether a shape fits on the board at the given position
+    def fits(self, tetromino, position):
+        return is_valid_position(tetromino, self.grid, position)
+
+    def move(self, dy, dx):
+        new_position = (self.current_position[0] + dy, self.current_position[1] + dx)
+        if self.game_over or not self.fits(self.current_tetromino, new_position):
+            return False
+        self.current_position = new_position
+        return True
+
+    def rotate(self, direction):
+        if self.game_over:
+            return False
+        new_rotation_state, kicks = self.orientations[self.current_tetromino_key][self.rotation_state]["rotations"][direction]
+        rotated = self.orientations[self.current_tetromino_key][new_rotation_state]["shape"]
+        # The first kick is (0, 0), the plain rotation
+        for dy, dx in kicks:
+            new_position = (self.current_position[0] + dy, self.current_position[1] + dx)
+            if self.fits(rotated, new_position):
+                self.current_position = new_position
+                self.current_tetromino = rotated
+                self.rotation_state = new_rotation_state
+                return True
+        return False
+
+    def hold(self):
+        # The hold slot can only be used once per piece
+        if self.game_over or self.hold_used:
+            return False
+        if self.hold_tetromino_key is None:
+            self.hold_tetromino_key = self.current_tetromino_key
+            self.spawn()
+        else:
+            self.hold_tetromino_key, key = self.current_tetromino_key, self.hold_tetromino_key
+            self.spawn(key)
+        self.hold_used = True
+        if self.on_event is not None:
+            self.on_event("hold", {"piece": self.current_tetromino_key, "held": self.hold_tetromino_key})
+        return True
+
+    def shadow_position(self):
+        return calculate_shadow_position(self.current_tetromino, self.grid, self.current_position)
+
+    # Lock the tetromino in place, clear lines and spawn the next one
+    def lock(self):
+        cleared_lines = self.place()
+        self.score += cleared_lines
+        if self.on_event is not None:
+            self.on_event("lock", {"piece": self.current_tetromino_key, "state": self.rotation_state,
+                                   "position": self.current_position, "lines": cleared_lines, "score_delta": cleared_lines})
+            if cleared_lines:
+                self.on_event("clear", {"lines": cleared_lines, "score": self.score})
+        self.hold_used = False  # Reset the hold action tracking for the next turn
+        self.spawn()
+        return cleared_lines
+
+    # Absolute grid cells covered by the current tetromino
+    def current_cells(self):
+        y, x = self.current_position
+        return [(y + i, x + j) for i, j in self.orientations[self.current_tetromino_key][self.rotation_state]["cells"]]
+
+    # Write the current tetromino into the grid and clear completed lines.
+    # Only the rows under the piece can have become full, and the feature
+    # cache knows which of them are.
+    def place(self):
+        cells = self.orientations[self.current_tetromino_key][self.rotation_state]["cells"]
+        place_cells(cells, self.pieces[self.current_tetromino_key]['ID'], self.grid, self.current_position)
+        full_rows = self.features.add_cells(self.grid, self.current_cells())
+        _, cleared_lines = clear_lines(self.grid, self.statistics, full_rows)
+        self.features.clear_rows(self.grid, full_rows)
+        self.update_hash(cells, cleared_lines)
+        return cleared_lines
+
+    # Update the Zobrist hash of the board after placing cells; a line clear moves every row above it, so rehash
+    def update_hash(self, cells, cleared_lines):
+        if cleared_lines:
+            self.board_hash = grid_hash(self.grid)
+        else:
+            self.board_hash = toggle_cells(self.board_hash, cells, self.current_position, self.grid.shape)
+
+    # Capture the whole game state, to come back to it later with restore
+    def snapshot(self):
+        return {
+            "grid": self.grid.copy(),
+            "features": self.features.copy(),
+            "board_hash": self.board_hash,
+            "statistics": copy.deepcopy(self.statistics),
+            "bag": list(self.bag),
+            "rng": self.rng.getstate(),
+            "score": self.score,
+            "game_over": self.game_over,
+            "next_tetromino_key": self.next_tetromino_key,
+            "hold_tetromino_key": self.hold_tetromino_key,
+            "hold_used": self.hold_used,
+            "current_tetromino_key": self.current_tetromino_key,
+            "rotation_state": self.rotation_state,
+            "current_position": self.current_position
+        }
+
+    # Return to a snapshot. The grid is overwritten in place, and the same
+    # snapshot can be restored any number of times.
+    def restore(self, snapshot):
+        self.grid[:] = snapshot["grid"]
+        self.features = snapshot["features"].copy()
+        self.statistics = copy.deepcopy(snapshot["statistics"])
+        self.bag[:] = snapshot["bag"]
+        self.rng.setstate(snapshot["rng"])
+        for name in ("board_hash", "score", "game_over", "next_tetromino_key", "hold_tetromino_key", "hold_used",
+                     "current_tetromino_key", "rotation_state", "current_position"):
+            setattr(self, name, snapshot[name])
+        self.current_tetromino = self.orientations[self.current_tetromino_key][self.rotation_state]["shape"]
+
+    def hard_drop(self):
+        if self.game_over:
+            return 0
+        self.current_position = self.shadow_position()
+        return self.lock()
+
+    # List every reachable final placement of the current piece, with the input path to each
+    def placements(self):
+        from placements import find_placements
+        return find_placements(self.current_tetromino_key, self.grid, self.current_position, self.rotation_state,
+                               piece_set=self.piece_set)
+
+    # Apply one input by name (see inputs)
+    def act(self, action):
+        if action in shifts:
+            return self.move(*shifts[action])
+        if action in next_rotation_state:
+            return self.rotate(action)
+        if action == "hold":
+            return self.hold()
+        if action == "hard_drop":
+            return self.hard_drop()
+        if action == "step":
+            return self.step()
+        raise ValueError(f"unknown action {action!r}, expected one of {list(inputs)}")
+
+    # Play a list of inputs ("left", "right", "down", "clockwise", "counter-clockwise") and hard drop
+    def apply_path(self, path):
+        for name in path:
+            self.act(name)
+        return self.hard_drop()
+
+    # Apply one gravity step: fall one row, or lock if the piece has landed
+    def step(self):
+        if self.game_over:
+            return 0
+        if self.move(1, 0):
+            return 0
+        return self.lock()
@@ -0,0 +1,124 @@
+'''
+Board features kept up to date as pieces lock and lines clear.
+
+Column heights, holes per column, well depths and row fill counts are
+computed once from the grid and then only patched: a lock touches the rows
+and columns under the piece, and a line clear shifts the row counts and
+lowers the columns instead of rescanning the board. Reading any feature is a
+plain attribute access. The row counts also tell which of the touched rows
+are full, so line detection no longer scans every row.
+'''
+
+class BoardFeatures:
+    def __init__(self, grid):
+        self.grid_height, self.grid_width = grid.shape
+        self.recompute(grid)
+
+    # Compute every feature from scratch
+    def recompute(self, grid):
+        filled = grid != 0
+        self.row_counts = [int(count) for count in filled.sum(axis=1)]
+        self.heights = [0] * self.grid_width
+        self.holes = [0] * self.grid_width
+        for j in range(self.grid_width):
+            self.scan_column(grid, j)
+        self.update_surface(range(self.grid_width))
+
+    # Recompute the height and holes of one column
+    def scan_column(self, grid, j):
+        column = grid[:, j] != 0
+        if not column.any():
+            self.heights[j] = 0
+            self.holes[j] = 0
+            return
+        height = self.grid_height - int(column.argmax())
+        self.heights[j] = height
+        self.holes[j] = height - int(column.sum())
+
+    # Recompute well depths, bumpiness and the totals after heights changed in some columns
+    def update_surface(self, columns):
+        heights = self.heights
+        width = self.grid_width
+        if len(columns) == width or not hasattr(self, "wells"):
+            self.wells = [0] * width
+            self.steps = [0] * (width - 1)
+            columns = range(width)
+        else:
+            # A column's well depth also depends on its neighbours
+            columns = {k for j in columns for k in (j - 1, j, j + 1) if 0 <= k < width}
+
+        for j in columns:
+            left = heights[j - 1] if j > 0 else self.grid_height
+            right = heights[j + 1] if j < width - 1 else self.grid_height
+            self.wells[j] = max(0, min(left, right) - heights[j])
+            if j < width - 1:
+                self.steps[j] = abs(heights[j] - heights[j + 1])
+            if j > 0:
+                self.steps[j - 1] = abs(heights[j - 1] - heights[j])
+
+        self.aggregate_height = sum(heights)
+        self.total_holes = sum(self.holes)
+        self.bumpiness = sum(self.steps)
+        self.max_well = max(self.wells)
+
+    # Update the features after cells were filled in the grid (already
+    # written), returning the full rows among the ones touched, top to bottom
+    def add_cells(self, grid, cells):
+        rows = set()
+        columns = set()
+        for i, j in cells:
+            self.row_counts[i] += 1
+            rows.add(i)
+            columns.add(j)
+
+        for j in columns:
+            top = self.grid_height - self.heights[j]
+            highest = min(i for i, k in cells if k == j)
+            if highest < top:
+                # The column grew: the empty cells between the old and the new top are now holes
+                self.holes[j] += top - highest - sum(1 for i, k in cells if k == j)
+                self.heights[j] = self.grid_height - highest
+            else:
+                # The piece filled cells below the top, which were holes
+                self.holes[j] -= sum(1 for i, k in cells if k == j)
+        self.update_surface(columns)
+
+        return sorted(i for i in rows if self.row_counts[i] == self.grid_width)
+
+    # Update the features after the given full rows were cleared from the grid
+    def clear_rows(self, grid, rows):
+        if not rows:
+            return
+        cleared = set(rows)
+        count = len(cleared)
+        self.row_counts = [0] * count + [c for i, c in enumerate(self.row_counts) if i not in cleared]
+
+        for j in range(self.grid_width):
+            if self.heights[j] == 0:
+                continue
+            if self.grid_height - self.heights[j] in cleared:
+                # The top of the column was cleared, so what was under it may be open now
+                self.scan_column(grid, j)
+            else:
+                self.heights[j] -= count
+        self.update_surface(range(self.grid_width))
+
+    # Copy the features, sharing nothing with the original
+    def copy(self):
+        features = BoardFeatures.__new__(BoardFeatures)
+        features.__dict__.update(self.__dict__)
+        for name in ("row_counts", "heights", "holes", "wells", "steps"):
+            setattr(features, name, list(getattr(self, name)))
+        return features
+
+    def as_dict(self):
+        return {
+            "heights": list(self.heights),
+            "holes": list(self.holes),
+            "wells": list(self.wells),
+            "row_counts": list(self.row_counts),
+            "aggregate_height": self.aggregate_height,
+            "total_holes": self.total_holes,
+            "bumpiness": self.bumpiness,
+            "max_well": self.max_well
+        }
@@ -0,0 +1,225 @@
+'''
+Lookahead autoplayer.
+
+LookaheadPlayer picks a placement for the current piece by searching the
+pieces that follow it: the current piece or the one in the hold slot, then
+the visible next piece, then an expectation over what is left in the bag.
+Every piece is expanded with find_placements and all its placements are
+scored in one evaluate_batch call; only the best beam_width of them are
+searched further (a beam over expectimax). Positions already scored are
+found again in a TranspositionTable, keyed by the Zobrist hash of the board
+and of the pieces still to come.
+
+Only the bottom of the board is searched: the rows from a few pieces above
+the top of the stack down. The rows above are empty whatever is played, so
+the features, line clears and hashes of the cropped boards are those of the
+whole board, and the cost of a search follows the height of the stack rather
+than the height of the board.
+
+The search deepens one piece at a time until the per-piece time budget runs
+out, and returns the best move of the deepest search that finished, so it
+keeps up however short fall_delay gets. With budget_ms=None it searches to
+max_depth every time, which makes it deterministic.
+'''
+
+import time
+
+import numpy as np
+
+from batch import default_weights, evaluate_batch
+from placements import find_placements
+from engine import piece_sets
+from transposition import TranspositionTable, grid_hash, piece_zobrist
+
+# Define the value of a board on which the next piece cannot be placed
+dead_value = -1e4
+
+# Define the exception that stops a search when its time budget is spent
+class OutOfTime(Exception):
+    pass
+
+# Hash the pieces still to come: the known ones in order, then the bag
+def sequence_hash(known, bag):
+    result = 0
+    for index, key in enumerate(known):
+        result ^= piece_zobrist("next", key) * (index + 1)
+    for key in bag:
+        result ^= piece_zobrist("bag", key)
+    return result & ((1 << 64) - 1)
+
+# Place a piece everywhere it can go on a board, returning the placements,
+# the resulting boards, the reward for the lines each clears and the
+# evaluation of each resulting board. Only the rows of the grid from row
+# start down are searched and kept in the boards; the rows above must be
+# empty deep enough for the piece to drop through, and a piece still above
+# them is soft dropped to row start first.
+def expand(grid, key, weights, position=None, rotation_state="0", piece_set=piece_sets["tetrominoes"], start=0):
+    width = grid.shape[1]
+    prefix = []
+    if start:
+        if position is None:
+            position = (0, (width - piece_set["orientations"][key]["0"]["shape"].shape[1]) // 2)
+        y, x = position
+        prefix = ["down"] * max(0, start - y)
+        position = (max(y, start) - start, x)
+    placements = find_placements(key, grid[start:], position, rotation_state, width=width, piece_set=piece_set)
+    if not placements:
+        return placements, None, None, None
+    boards = np.broadcast_to(grid[start:], (len(placements), grid.shape[0] - start, width))
+    boards, features = evaluate_batch(boards, [(key, state) for state, _, _ in placements],
+                                      [position for _, position, _ in placements], piece_set)
+    if start:
+        placements = [(state, (y + start, x), prefix + path) for state, (y, x), path in placements]
+    reward = weights["lines_cleared"] * features["lines_cleared"]
+    static = sum(weight * features[name] for name, weight in weights.items() if name != "lines_cleared")
+    return placements, boards, reward, static
+
+# Define a player that searches the coming pieces for the best placement
+class LookaheadPlayer:
+    def __init__(self, budget_ms=50, max_depth=3, beam_width=4, weights=default_weights, table=None):
+        self.budget_ms = budget_ms
+        self.max_depth = max_depth
+        self.beam_width = beam_width
+        self.weights = weights
+        self.table = table if table is not None else TranspositionTable(4 * 1024 * 1024)
+        self.deadline = None
+        self.piece_set = piece_sets["tetrominoes"]
+        self.height = None
+        self.expand_time = 0
+
+    # Tell whether the budget is spent, or would be after another margin seconds
+    def out_of_time(self, margin=0):
+        return self.deadline is not None and time.perf_counter() + margin > self.deadline
+
+    def check_time(self, margin=0):
+        if self.out_of_time(margin):
+            raise OutOfTime()
+
+    # Expected best total from a board, given the pieces to come: the known
+    # ones first, then every piece the bag can still give
+    def value(self, board, static, known, bag, depth):
+        if depth == 0:
+            return static
+        self.check_time()
+        key = grid_hash(board, self.height) ^ sequence_hash(known, bag)
+        cached = self.table.get(key, depth)
+        if cached is not None:
+            return cached
+
+        if known:
+            result = self.best(board, known[0], known[1:], bag, depth)
+        else:
+            remaining = bag or self.piece_set["keys"]  # An empty bag is refilled with every piece
+            result = sum(self.best(board, piece, (), tuple(k for k in remaining if k != piece), depth)
+                         for piece in remaining) / len(remaining)
+        self.table.put(key, result, depth)
+        return result
+
+    # Best total from playing one piece on a board and going on with the rest
+    def best(self, board, piece, known, bag, depth):
+        # Do not start an expansion that would end past the deadline
+        self.check_time(self.expand_time)
+        placements, boards, reward, static = expand(board, piece, self.weights, piece_set=self.piece_set)
+        if not placements:
+            return dead_value
+        totals = reward + static
+        if depth == 1:
+            return float(totals.max())
+        order = np.argsort(-totals, kind="stable")[:self.beam_width]
+        return max(reward[i] + self.value(boards[i], static[i], known, bag, depth - 1) for i in order)
+
+    # List the moves open to the engine: play the current piece where it is,
+    # or hold and play the held (or the next) piece from the spawn position.
+    # The time the first expansion takes is kept as the estimate of the next
+    # ones, and the hold option is left out when what is left of the budget
+    # would not cover it.
+    def root_moves(self, engine, start=0):
+        bag = tuple(engine.bag)
+        options = [([], engine.current_tetromino_key, engine.current_position, engine.rotation_state,
+                    (engine.next_tetromino_key,))]
+        if not engine.hold_used:
+            if engine.hold_tetromino_key is not None:
+                options.append((["hold"], engine.hold_tetromino_key, None, "0", (engine.next_tetromino_key,)))
+            else:
+                options.append((["hold"], engine.next_tetromino_key, None, "0", ()))
+
+        moves = []
+        for index, (prefix, key, position, rotation_state, known) in enumerate(options):
+            if index and self.out_of_time(self.expand_time):
+                break
+            start_time = time.perf_counter()
+            placements, boards, reward, static = expand(engine.grid, key, self.weights, position, rotation_state,
+                                                        self.piece_set, start)
+            if not index:
+                self.expand_time = time.perf_counter() - start_time
+            for i, (state, final_position, path) in enumerate(placements):
+                moves.append({
+                    "path": prefix + path,
+                    "key": key,
+                    "state": state,
+                    "position": final_position,
+                    "board": boards[i],
+                    "reward": float(reward[i]),
+                    "static": float(static[i]),
+                    "known": known,
+                    "bag": bag
+                })
+        return moves
+
+    # Choose a move for the current piece. Returns its input path (ending
+    # before the hard drop), the depth searched and its value, or None when
+    # the piece cannot be placed anywhere.
+    def choose(self, engine):
+        start_time = time.perf_counter()
+        self.deadline = None if self.budget_ms is None else start_time + self.budget_ms / 1000
+        self.piece_set = engine.piece_set
+        self.height = engine.grid.shape[0]
+
+        # Leave room above the stack for every piece searched, and one more
+        # so the deepest piece still enters the cropped board from open air
+        filled = np.flatnonzero(engine.grid.any(axis=1))
+        top = filled[0] if len(filled) else self.height
+        start = max(0, int(top) - self.piece_set["size"] * (self.max_depth + 1))
+        moves = self.root_moves(engine, start)
+        if not moves:
+            return None
+
+        # A one-piece search needs no lookahead and always finishes
+        for move in moves:
+            move["value"] = move["reward"] + move["static"]
+        moves.sort(key=lambda move: -move["value"])
+        best, depth = moves[0], 1
+
+        for next_depth in range(2, self.max_depth + 1):
+            candidates = moves[:self.beam_width]
+            # Keep the values of the last finished depth until this one finishes too
+            try:
+                values = [move["reward"] + self.value(move["board"], move["static"], move["known"], move["bag"],
+                                                      next_depth - 1) for move in candidates]
+            except OutOfTime:
+                break
+            for move, value in zip(candidates, values):
+                move["value"] = value
+            # Search the most promising moves first at the next depth
+            candidates.sort(key=lambda move: -move["value"])
+            moves[:self.beam_width] = candidates
+            best, depth = candidates[0], next_depth
+        self.deadline = None
+
+        return {
+            "path": best["path"],
+            "key": best["key"],
+            "state": best["state"],
+            "position": best["position"],
+            "depth": depth,
+            "value": best["value"],
+            "elapsed_ms": 1000 * (time.perf_counter() - start_time)
+        }
+
+    # Play as a runner policy: pick among the placements of the current piece
+    # (holding when the search prefers it, through the returned path)
+    def __call__(self, engine, placements):
+        move = self.choose(engine)
+        if move is None:
+            return placements[0]
+        return move["state"], move["position"], move["path"]
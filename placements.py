@@ -0,0 +1,147 @@
+'''
+Enumerate every reachable final placement of a piece.
+
+The search is a breadth-first walk over (rotation state, row, column) from the
+spawn position using the same inputs a player has: shifts, soft drops and SRS
+rotations with the wall kicks from the orientation table. Before searching,
+the board is turned into one bitmask per orientation and row whose bit x is
+set when the piece fits at column x, so every step of the walk is a single
+bit test. Placements that cover the same cells are reported once, with the
+shortest input path that reaches them.
+'''
+
+from collections import deque
+
+from bitboard import grid_to_rows
+from engine import grid_width, piece_sets
+
+# Build, for every orientation and row, the bitmask of columns where it fits.
+# Bit x + pad is set when the piece fits with the origin of its matrix at
+# column x, pad being how far the matrix can hang off the left wall.
+def fit_masks(tetromino_key, rows, width=grid_width, piece_set=piece_sets["tetrominoes"]):
+    height = len(rows)
+    size = piece_set["size"]
+    pad = size - 1
+    columns = (1 << (width + pad)) - 1
+    border = ((1 << pad) - 1) | (((1 << (pad + size)) - 1) << (width + pad))
+    blocked = ~0
+    padded = [(row << pad) | border for row in rows]
+
+    masks = {}
+    for state, orientation in piece_set["orientations"][tetromino_key].items():
+        masks[state] = [0] * (height + size)
+        for y in range(-pad, height):
+            invalid = 0
+            for i, j in orientation["cells"]:
+                row = y + i
+                invalid |= (padded[row] if 0 <= row < height else blocked) >> j
+            masks[state][y + pad] = ~invalid & columns
+    return masks
+
+# Find every final placement of a piece, as (rotation state, position, path)
+# tuples where path is the list of inputs that reaches it from the spawn
+def find_placements(tetromino_key, grid=None, position=None, rotation_state="0", rows=None, width=None,
+                    piece_set=piece_sets["tetrominoes"]):
+    if rows is None:
+        rows = grid_to_rows(grid)
+    if width is None:
+        width = grid.shape[1] if grid is not None else grid_width
+    orientations = piece_set["orientations"]
+    pad = piece_set["size"] - 1
+    if position is None:
+        position = (0, (width - orientations[tetromino_key]["0"]["shape"].shape[1]) // 2)
+    masks = fit_masks(tetromino_key, rows, width, piece_set)
+
+    # Nodes are (rotation state, row + pad, column + pad) so that the fit test
+    # is masks[state][row] >> column & 1
+    rotations = {
+        state: [(direction, new_state, [(dy, dx) for dy, dx in kicks])
+                for direction, (new_state, kicks) in orientation["rotations"].items()]
+        for state, orientation in orientations[tetromino_key].items()
+    }
+    last_row = len(rows) + pad
+
+    start = (rotation_state, position[0] + pad, position[1] + pad)
+    if not 0 <= start[1] < last_row or not masks[rotation_state][start[1]] >> start[2] & 1:
+        return []
+
+    # Above the stack every row looks the same to every orientation, so soft
+    # drops through that open air jump straight to a few rows above the point
+    # where it ends (kicks reach at most two rows down)
+    open_air = start[1]
+    while open_air + 1 < last_row and all(masks[state][open_air + 1] == masks[state][start[1]] for state in masks):
+        open_air += 1
+    landing = open_air - 2
+
+    # Walk the move graph, remembering how each node was first reached
+    parents = {start: None}
+    queue = deque([start])
+    finals = []
+    while queue:
+        node = queue.popleft()
+        state, y, x = node
+        row = masks[state][y]
+
+        # Shift left and right
+        if x > 0 and row >> (x - 1) & 1:
+            target = (state, y, x - 1)
+            if target not in parents:
+                parents[target] = (node, ("left",))
+                queue.append(target)
+        if row >> (x + 1) & 1:
+            target = (state, y, x + 1)
+            if target not in parents:
+                parents[target] = (node, ("right",))
+                queue.append(target)
+
+        # Rotate both ways, taking the first kick that fits
+        for direction, new_state, kicks in rotations[state]:
+            new_masks = masks[new_state]
+            for dy, dx in kicks:
+                ty = y + dy
+                if 0 <= ty < last_row and x + dx >= 0 and new_masks[ty] >> (x + dx) & 1:
+                    target = (new_state, ty, x + dx)
+                    if target not in parents:
+                        parents[target] = (node, (direction,))
+                        queue.append(target)
+                    break
+
+        # Soft drop, or record the node as a final placement when it has landed
+        if start[1] <= y < landing:
+            target = (state, landing, x)
+            if target not in parents:
+                parents[target] = (node, ("down",) * (landing - y))
+                queue.append(target)
+        elif y + 1 < last_row and masks[state][y + 1] >> x & 1:
+            target = (state, y + 1, x)
+            if target not in parents:
+                parents[target] = (node, ("down",))
+                queue.append(target)
+        else:
+            finals.append(node)
+
+    # Report each distinct set of covered cells once, with its shortest path
+    placements = []
+    seen = set()
+    for node in finals:
+        state, y, x = node
+        y, x = y - pad, x - pad
+        cells = frozenset((y + i, x + j) for i, j in orientations[tetromino_key][state]["cells"])
+        if cells in seen:
+            continue
+        seen.add(cells)
+        placements.append((state, (y, x), input_path(parents, node)))
+    return placements
+
+# Follow the parent links back to the start and return the inputs in order
+def input_path(parents, node):
+    path = []
+    while parents[node] is not None:
+        node, names = parents[node]
+        path.extend(reversed(names))
+    path.reverse()
+
+    # The hard drop that locks the piece makes trailing soft drops redundant
+    while path and path[-1] == "down":
+        path.pop()
+    return path
@@ -0,0 +1,59 @@
+'''
+Per-phase timing of the main loop.
+
+The loop calls lap(phase) at the end of each phase; the time since the
+previous lap is added to that phase's rolling window of samples, from which
+p50/p99 are computed on demand. A disabled profiler returns from lap() right
+away, so the calls can stay in the hot path.
+'''
+
+import json
+import time
+from collections import deque
+
+class Profiler:
+    def __init__(self, enabled=True, window=600):
+        self.enabled = enabled
+        self.window = window
+        self.samples = {}
+        self.last = time.perf_counter()
+
+    # Start timing a new frame (or any other sequence of phases)
+    def begin(self):
+        if self.enabled:
+            self.last = time.perf_counter()
+
+    # Close the current phase and start the next one
+    def lap(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        samples = self.samples.get(phase)
+        if samples is None:
+            samples = self.samples[phase] = deque(maxlen=self.window)
+        samples.append(now - self.last)
+        self.last = now
+
+    # Summarize every phase's recent samples in milliseconds
+    def summary(self):
+        result = {}
+        for phase, samples in self.samples.items():
+            ordered = sorted(samples)
+            count = len(ordered)
+            result[phase] = {
+                "count": count,
+                "mean": 1000 * sum(ordered) / count,
+                "p50": 1000 * ordered[count // 2],
+                "p99": 1000 * ordered[min(count - 1, int(count * 0.99))],
+                "max": 1000 * ordered[-1]
+            }
+        return result
+
+    # Format the summary as short lines for the on-screen overlay
+    def overlay_lines(self):
+        return [f"{phase[:8]:8} {values['p50']:5.2f} {values['p99']:6.2f}" for phase, values in self.summary().items()]
+
+    # Write the summary to a JSON file
+    def dump(self, path):
+        with open(path, "w") as file:
+            json.dump(self.summary(), file, indent=2)
@@ -0,0 +1,297 @@
+'''
+Dirty-rectangle renderer for the pygame window.
+
+The locked cells of the board live on their own cached surface, and only the
+cells that changed since the last frame (after a lock or a line clear) are
+redrawn on it. The falling piece and its shadow are drawn on top every frame
+after restoring the board under where they were before. Text is re-rendered
+only when its value changes, and only the rectangles that were touched are
+sent to pygame.display.update instead of flipping the whole window.
+
+The cell size shrinks to fit larger boards in the window. Small cells are
+filled solid, so the changed band of rows is then painted in one go from a
+colour palette with pygame.surfarray instead of one rectangle per cell.
+
+Rendered text is kept in a bounded LRU cache keyed by (string, color), and the
+score and statistics are composited onto a single panel surface that is only
+rebuilt when one of their values changes.
+'''
+
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+
+from engine import shape_cells
+from profiler import Profiler
+
+# Define the colors
+colors = {
+    "cyan": (0, 255, 255),
+    "yellow": (255, 255, 0),
+    "purple": (128, 0, 128),
+    "green": (0, 128, 0 ),
+    "red": (255, 0, 0),
+    "blue": (0, 0, 255),
+    "orange": (255, 165, 0),
+    "pink": (255, 105, 180),
+    "lime": (0, 255, 0),
+    "teal": (0, 128, 128),
+    "brown": (139, 69, 19),
+    "olive": (128, 128, 0),
+    "black": (0, 0, 0),
+    "grey": (100, 100, 100),
+    "white": (255, 255, 255)
+}
+
+# Define the width of the outline drawn around a locked cell; a cell no
+# larger than twice this is drawn solid
+cell_outline = 8
+
+# Define the color of each piece ID of a piece set as it appears in the grid
+def piece_colors(pieces):
+    return {piece["ID"]: colors[piece["color"]] for piece in pieces.values()}
+
+# Define a cache of rendered text surfaces with least-recently-used eviction
+class TextCache:
+    def __init__(self, font, max_size=256):
+        self.font = font
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text, color):
+        key = (text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = self.font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+class Renderer:
+    def __init__(self, window, font, grid_side=30, text_cache_size=256, profiler=None, overlay_font=None):
+        self.window = window
+        self.font = font
+        self.profiler = profiler if profiler is not None else Profiler(enabled=False)
+        self.overlay_text = TextCache(overlay_font) if overlay_font is not None else None
+        self.text = TextCache(font, text_cache_size)
+        self.grid_side = grid_side
+        self.window_width, self.window_height = window.get_size()
+
+        # Define the cached surface holding the locked cells of the board,
+        # created for the board size and piece set of the first engine drawn
+        self.board = None
+        self.cell_side = grid_side
+        self.pieces = None
+        self.id_colors = {}
+        self.palette = None
+        self.drawn_grid = None
+
+        # Define what is currently on screen, to know what needs redrawing
+        self.piece_rects = []
+        self.next_panel = None
+        self.hold_panel = None
+        self.statistics_panel = None
+        self.overlay_rect = None
+        self.full_redraw = True
+
+        # Define the area below the board holding the score and the statistics
+        top = self.window_height - 90 - 6 * 30
+        self.statistics_rect = pygame.Rect(0, top, self.window_width, self.window_height - top)
+        self.statistics_surface = pygame.Surface(self.statistics_rect.size)
+
+    # Force everything to be redrawn on the next frame
+    def invalidate(self):
+        self.drawn_grid = None
+        self.next_panel = None
+        self.hold_panel = None
+        self.statistics_panel = None
+        self.full_redraw = True
+
+    # Draw a frame. fall_offset is how far (0 to 1 of a cell) the falling piece
+    # has travelled towards the next row, to interpolate between logic ticks.
+    def draw(self, engine, tps, fall_offset=0.0):
+        dirty = []
+        if self.full_redraw:
+            self.window.fill(colors["black"])
+            dirty.append(self.window.get_rect())
+            self.full_redraw = False
+
+        if engine.pieces is not self.pieces:
+            self.set_pieces(engine.pieces)
+        self.draw_board(engine.grid, dirty)
+        self.profiler.lap("grid")
+        self.draw_piece(engine, fall_offset, dirty)
+        self.draw_next(engine.next_tetromino_key, tps, dirty)
+        self.draw_hold(engine.hold_tetromino_key, dirty)
+        self.profiler.lap("panels")
+        self.draw_statistics(engine.statistics, engine.score, dirty)
+        self.profiler.lap("hud")
+
+        pygame.display.update(dirty)
+        self.profiler.lap("display")
+        return dirty
+
+    # Define the colors of a piece set, as a dict and as a palette indexed by ID
+    def set_pieces(self, pieces):
+        self.pieces = pieces
+        self.id_colors = piece_colors(pieces)
+        self.palette = np.zeros((max(self.id_colors) + 1, 3), dtype=np.uint8)
+        for piece_id, color in self.id_colors.items():
+            self.palette[piece_id] = color
+        self.drawn_grid = None
+
+    # Size the cells so the board fits beside the panels and above the statistics
+    def set_board_size(self, height, width):
+        self.cell_side = max(1, min(self.grid_side, (self.window_width - 7 * self.grid_side) // width,
+                                    (self.window_height - self.statistics_rect.height) // height))
+        self.board = pygame.Surface((width * self.cell_side, height * self.cell_side), 0, 32)
+
+    # Redraw the cells of the locked board that changed since the last frame
+    def draw_board(self, grid, dirty):
+        if self.drawn_grid is None or self.drawn_grid.shape != grid.shape:
+            self.set_board_size(*grid.shape)
+            self.drawn_grid = np.full(grid.shape, -1)  # Differs from every cell
+
+        rows = np.flatnonzero((grid != self.drawn_grid).any(axis=1))
+        if len(rows) and self.cell_side <= 2 * cell_outline + 1:
+            self.draw_rows(grid, rows[0], rows[-1] + 1, dirty)
+        elif len(rows):
+            self.draw_changed(grid, np.argwhere(grid != self.drawn_grid), dirty)
+        self.drawn_grid = grid.copy()
+
+    # Paint a band of rows from the palette in one array blit (cells drawn solid,
+    # with the same one-pixel gap on their right and bottom as draw_changed leaves)
+    def draw_rows(self, grid, top, bottom, dirty):
+        side = self.cell_side
+        pixels = np.repeat(np.repeat(self.palette[grid[top:bottom]], side, axis=0), side, axis=1)
+        if side > 1:
+            pixels[side - 1::side] = 0
+            pixels[:, side - 1::side] = 0
+        rect = pygame.Rect(0, top * side, grid.shape[1] * side, (bottom - top) * side)
+        pygame.surfarray.blit_array(self.board.subsurface(rect), pixels.transpose(1, 0, 2))
+        self.window.blit(self.board, rect, rect)
+        dirty.append(rect)
+
+    # Redraw the given cells one by one, with their outline
+    def draw_changed(self, grid, changed, dirty):
+        grid_side = self.cell_side
+        for i, j in changed:
+            cell = (j * grid_side, i * grid_side, grid_side, grid_side)
+            self.board.fill(colors["black"], cell)
+            color = self.id_colors.get(grid[i, j], colors["black"])
+            pygame.draw.rect(self.board, color, (j*grid_side, i*grid_side, grid_side-1, grid_side-1), cell_outline)
+            self.window.blit(self.board, cell, cell)
+            dirty.append(pygame.Rect(cell))
+
+    # Restore the board under last frame's piece and shadow, then draw them again
+    def draw_piece(self, engine, fall_offset, dirty):
+        for rect in self.piece_rects:
+            self.window.blit(self.board, rect, rect)
+        dirty.extend(self.piece_rects)
+
+        shadow_position = engine.shadow_position()
+        self.profiler.lap("shadow")
+        color = colors[engine.pieces[engine.current_tetromino_key]["color"]]
+        side = self.cell_side
+        self.piece_rects = self.draw_cells(engine.current_tetromino, shadow_position, colors["grey"], (0, 0), side)
+        y, x = engine.current_position
+        if not engine.fits(engine.current_tetromino, (y + 1, x)):
+            fall_offset = 0.0
+        self.piece_rects += self.draw_cells(engine.current_tetromino, engine.current_position, color, (0, int(fall_offset * side)), side)
+        dirty.extend(self.piece_rects)
+        self.profiler.lap("piece")
+
+    # Draw the filled cells of a shape with a white outline, returning their rects
+    def draw_cells(self, tetromino, position, color, origin, grid_side=None):
+        grid_side = grid_side or self.grid_side
+        rects = []
+        for i, j in shape_cells(tetromino):
+            rect = pygame.Rect(origin[0] + (position[1] + j)*grid_side, origin[1] + (position[0] + i)*grid_side, grid_side, grid_side)
+            pygame.draw.rect(self.window, color, rect)
+            pygame.draw.rect(self.window, colors["white"], rect, 1)
+            rects.append(rect)
+        return rects
+
+    # Display the next tetromino (the TPS readout shares its panel)
+    def draw_next(self, next_tetromino_key, tps, dirty):
+        tps_text = f"TPS: {tps:.2f}"
+        if self.next_panel == (next_tetromino_key, tps_text):
+            return
+        self.next_panel = (next_tetromino_key, tps_text)
+
+        grid_side = self.grid_side
+        panel = pygame.Rect(self.window_width-grid_side*7, 0, grid_side*6, grid_side*5)
+        self.window.fill(colors["black"], panel)
+        pygame.draw.rect(self.window, colors["white"], panel, 2)
+        next_tetromino = self.pieces[next_tetromino_key]
+        self.draw_cells(next_tetromino["shape"], (0, 0), colors[next_tetromino["color"]], (self.window_width-grid_side*6, 0))
+        self.window.blit(self.text.render(tps_text, colors["white"]), (self.window_width - 150, 10))
+        dirty.append(panel)
+
+    # Display the hold tetromino
+    def draw_hold(self, hold_tetromino_key, dirty):
+        if self.hold_panel == (hold_tetromino_key,):
+            return
+        self.hold_panel = (hold_tetromino_key,)
+
+        grid_side = self.grid_side
+        panel = pygame.Rect(self.window_width-grid_side*7, grid_side*7, grid_side*6, grid_side*6)
+        self.window.fill(colors["black"], panel)
+        pygame.draw.rect(self.window, colors["red"], panel, 2)
+        if hold_tetromino_key is not None:
+            hold_tetromino = self.pieces[hold_tetromino_key]
+            self.draw_cells(hold_tetromino["shape"], (0, 0), colors[hold_tetromino["color"]], (self.window_width-grid_side*6, grid_side*7))
+        dirty.append(panel)
+
+    # Display the score and the statistics, rebuilding the panel only when a value changed
+    def draw_statistics(self, statistics, score, dirty):
+        values = (score, statistics["total_tetrominoes"],
+                  tuple(statistics["tetromino_counts"].items()), tuple(statistics["line_clears"].items()))
+        if self.statistics_panel == values:
+            return
+        self.statistics_panel = values
+
+        window_width, window_height, grid_side = self.window_width, self.window_height, self.grid_side
+        surface = self.statistics_surface
+        surface.fill(colors["black"])
+        top = self.statistics_rect.top
+        white = colors["white"]
+
+        surface.blit(self.text.render(f"Score: {score}", white), (window_width-grid_side*7, window_height - grid_side - top))
+        surface.blit(self.text.render(f"Total Tetrominoes: {statistics['total_tetrominoes']}", white), (10, window_height - 60 - top))
+
+        # Seven counts to a column, so larger piece sets spread to the right
+        for i, (tetromino, count) in enumerate(statistics["tetromino_counts"].items()):
+            surface.blit(self.text.render(f"{tetromino}: {count}", white), (10 + i // 7 * 90, window_height - 90 - i % 7 * 30 - top))
+
+        for i, (line_clear, count) in enumerate(statistics["line_clears"].items()):
+            surface.blit(self.text.render(f"{line_clear.capitalize()}: {count}", white), (window_width - 150, window_height - 90 - i * 30 - top))
+
+        self.window.blit(surface, self.statistics_rect)
+        dirty.append(self.statistics_rect)
+
+    # Display the profiler's p50/p99 phase times (in ms) under the hold panel
+    def draw_overlay(self):
+        if self.overlay_text is None:
+            return
+        grid_side = self.grid_side
+        x, y = self.window_width-grid_side*7, grid_side*13 + 10
+        rects = [self.overlay_rect] if self.overlay_rect is not None else []
+        if self.overlay_rect is not None:
+            self.window.fill(colors["black"], self.overlay_rect)
+
+        lines = ["phase      p50    p99"] + self.profiler.overlay_lines()
+        for line in lines:
+            rects.append(self.window.blit(self.overlay_text.render(line, colors["grey"]), (x, y)))
+            y += self.overlay_text.font.get_linesize()
+        self.overlay_rect = rects[-len(lines)].unionall(rects[-len(lines):])
+        pygame.display.update(rects)
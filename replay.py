@@ -0,0 +1,128 @@
+'''
+Record games and play them back.
+
+A game is fully determined by its seed and the inputs applied to it, so a
+replay stores only those: a header with the seed, one fixed-size record per
+input (milliseconds since the start of the game and the input code), and a
+footer with the final score, statistics and a checksum of the grid. Playback
+can run in real time through main.py --replay, or fast-forward headlessly
+here to check the footer against a fresh simulation:
+
+    python replay.py games/*.trpl
+'''
+
+import argparse
+import struct
+import sys
+import zlib
+
+from engine import TetrisEngine, inputs, new_statistics
+
+# Define the binary layout of a replay file
+magic = b"TRPL"
+version = 1
+header_format = struct.Struct("<4sBQ")
+event_format = struct.Struct("<IB")
+footer_format = struct.Struct("<14I")  # score, total, 7 piece counts, 4 line clears, grid CRC
+end_of_events = 0xFF
+
+# Summarize the final state of a game as stored in the replay footer
+def final_state(engine):
+    statistics = engine.statistics
+    return {
+        "score": engine.score,
+        "total_tetrominoes": statistics["total_tetrominoes"],
+        "tetromino_counts": list(statistics["tetromino_counts"].values()),
+        "line_clears": list(statistics["line_clears"].values()),
+        "grid_crc": zlib.crc32(engine.grid.astype("<i4").tobytes())
+    }
+
+# Define a writer that streams the inputs of a game to a replay file
+class ReplayWriter:
+    def __init__(self, path, seed):
+        self.file = open(path, "wb")
+        self.file.write(header_format.pack(magic, version, seed))
+
+    def record(self, time, action):
+        self.file.write(event_format.pack(time, inputs.index(action)))
+
+    # Write the footer with the final state of the game and close the file
+    def close(self, engine):
+        final = final_state(engine)
+        self.file.write(event_format.pack(0, end_of_events))
+        self.file.write(footer_format.pack(final["score"], final["total_tetrominoes"],
+                                           *final["tetromino_counts"], *final["line_clears"], final["grid_crc"]))
+        self.file.close()
+
+# Read a replay file into its seed, its (time, input) events and its final state
+def read_replay(path):
+    with open(path, "rb") as file:
+        data = file.read()
+
+    if len(data) < header_format.size:
+        raise ValueError(f"{path} is not a version {version} replay file")
+    file_magic, file_version, seed = header_format.unpack_from(data, 0)
+    if file_magic != magic or file_version != version:
+        raise ValueError(f"{path} is not a version {version} replay file")
+
+    events = []
+    final = None
+    offset = header_format.size
+    while offset + event_format.size <= len(data):
+        time, code = event_format.unpack_from(data, offset)
+        offset += event_format.size
+        if code == end_of_events:
+            if offset + footer_format.size > len(data):
+                break
+            values = footer_format.unpack_from(data, offset)
+            statistics_size = len(new_statistics()["tetromino_counts"])
+            final = {
+                "score": values[0],
+                "total_tetrominoes": values[1],
+                "tetromino_counts": list(values[2:2 + statistics_size]),
+                "line_clears": list(values[2 + statistics_size:-1]),
+                "grid_crc": values[-1]
+            }
+            break
+        if code >= len(inputs):
+            raise ValueError(f"{path} is not a version {version} replay file")
+        events.append((time, inputs[code]))
+
+    return {"seed": seed, "events": events, "final": final}
+
+# Replay every input as fast as possible and return the resulting engine
+def play_replay(replay):
+    engine = TetrisEngine(replay["seed"])
+    for _, action in replay["events"]:
+        engine.act(action)
+    return engine
+
+# Fast-forward a replay file and check that it ends where it was recorded to end
+def verify_replay(path):
+    replay = read_replay(path)
+    engine = play_replay(replay)
+    return replay["final"] == final_state(engine), engine, replay
+
+def main():
+    parser = argparse.ArgumentParser(description="Fast-forward replay files and check their final state.")
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    failures = 0
+    for path in args.paths:
+        try:
+            ok, engine, replay = verify_replay(path)
+        except (OSError, ValueError) as error:
+            failures += 1
+            print(f"{path}: INVALID {error}")
+            continue
+        if replay["final"] is None:
+            status = "INCOMPLETE"
+        else:
+            status = "OK" if ok else "MISMATCH"
+        failures += not ok
+        print(f"{path}: {status} score={engine.score} inputs={len(replay['events'])}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
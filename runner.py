@@ -0,0 +1,103 @@
+'''
+Play many headless games in parallel.
+
+Every game gets its own seed, so its piece order depends only on that seed and
+not on the state of the global random module or on which worker ran it. Games
+are spread over a process pool and their results are streamed back as soon as
+each one finishes, with the statistics of all games merged together.
+
+    python runner.py --games 1000 --workers 8 --seed 0
+'''
+
+import argparse
+import json
+import multiprocessing
+import random
+import time
+from functools import partial
+
+from batch import score_placements
+from bitboard import BitboardEngine
+from engine import merge_statistics, new_statistics
+from lookahead import LookaheadPlayer
+
+# Pick the placement with the best board evaluation
+def greedy_policy(engine, placements):
+    scores = score_placements(engine.grid, [(engine.current_tetromino_key, state, position) for state, position, _ in placements],
+                              piece_set=engine.piece_set)
+    return placements[int(scores.argmax())]
+
+# Pick any reachable placement
+def random_policy(engine, placements):
+    return engine.rng.choice(placements)
+
+# Define the policies a game can be played with
+policies = {
+    "greedy": greedy_policy,
+    "random": random_policy,
+    # A fixed depth instead of a time budget keeps games reproducible from their seed
+    "lookahead": LookaheadPlayer(budget_ms=None, max_depth=2)
+}
+
+# Play one game to the end (or to max_pieces) and summarize it
+def play_game(seed, policy="greedy", max_pieces=None):
+    engine = BitboardEngine(seed)
+    choose = policies[policy]
+    pieces = 0
+    while not engine.game_over and (max_pieces is None or pieces < max_pieces):
+        state, position, path = choose(engine, engine.placements())
+        engine.apply_path(path)
+        pieces += 1
+
+    return {
+        "seed": seed,
+        "score": engine.score,
+        "pieces": pieces,
+        "game_over": engine.game_over,
+        "statistics": engine.statistics
+    }
+
+# Play every seed on a pool of worker processes, yielding results as they finish
+def run_games(seeds, workers=None, policy="greedy", max_pieces=None, statistics=None):
+    if statistics is None:
+        statistics = new_statistics()
+    game = partial(play_game, policy=policy, max_pieces=max_pieces)
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(game, seeds, chunksize=1):
+            merge_statistics(statistics, result["statistics"])
+            yield result
+
+def main():
+    parser = argparse.ArgumentParser(description="Play headless Tetris games in parallel.")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of CPUs")
+    parser.add_argument("--seed", type=int, default=None, help="seed used to draw one seed per game")
+    parser.add_argument("--policy", choices=sorted(policies), default="greedy")
+    parser.add_argument("--max-pieces", type=int, default=None)
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    seeds = [rng.getrandbits(32) for _ in range(args.games)]
+
+    statistics = new_statistics()
+    start_time = time.perf_counter()
+    pieces = 0
+    scores = []
+    for result in run_games(seeds, args.workers, args.policy, args.max_pieces, statistics):
+        pieces += result["pieces"]
+        scores.append(result["score"])
+        if not args.quiet:
+            print(json.dumps({key: result[key] for key in ("seed", "score", "pieces", "game_over")}), flush=True)
+    elapsed_time = time.perf_counter() - start_time
+
+    print(json.dumps({
+        "games": len(scores),
+        "pieces": pieces,
+        "mean_score": sum(scores) / len(scores) if scores else 0,
+        "pieces_per_second": pieces / elapsed_time if elapsed_time > 0 else 0,
+        "statistics": statistics
+    }))
+
+if __name__ == "__main__":
+    main()
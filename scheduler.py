@@ -0,0 +1,104 @@
+'''
+Fixed-timestep game logic.
+
+Gravity and DAS are counted in integer ticks instead of being compared with
+the wall clock, so a game behaves the same whatever the frame rate is. The
+TickScheduler turns elapsed real time into a number of ticks to run (catching
+up after a stall, up to a limit) and reports how far into the next tick the
+frame is, so rendering can interpolate. Nothing here needs a clock at all to
+run: a headless simulation can call TickController.tick in a plain loop as
+fast as it likes.
+'''
+
+from profiler import Profiler
+
+# Convert a delay in milliseconds to a whole number of ticks (at least one)
+def to_ticks(milliseconds, tick_rate):
+    return max(1, round(milliseconds * tick_rate / 1000))
+
+# Define a scheduler that runs logic at a fixed tick rate from real time
+class TickScheduler:
+    def __init__(self, tick_rate=60, max_catch_up=30):
+        self.tick_rate = tick_rate
+        self.tick_ms = 1000 / tick_rate
+        self.max_catch_up = max_catch_up
+        self.tick = 0
+        self.last_time = None
+        self.accumulator = 0.0
+
+    # Return how many ticks are due at time now (in milliseconds)
+    def advance(self, now):
+        if self.last_time is None:
+            self.last_time = now
+        self.accumulator += now - self.last_time
+        self.last_time = now
+
+        due = int(self.accumulator // self.tick_ms)
+        if due > self.max_catch_up:
+            # Drop the time we cannot catch up on instead of falling further behind
+            due = self.max_catch_up
+            self.accumulator = due * self.tick_ms
+        self.accumulator -= due * self.tick_ms
+        return due
+
+    # Run the ticks due at time now, yielding the number of each one
+    def ticks(self, now):
+        for _ in range(self.advance(now)):
+            self.tick += 1
+            yield self.tick
+
+    # Fraction of the next tick that has already elapsed, for interpolation
+    def alpha(self):
+        return self.accumulator / self.tick_ms
+
+    # Game time of the current tick in milliseconds
+    def time(self):
+        return int(self.tick * self.tick_ms)
+
+# Define the gravity and DAS rules of the game, counted in ticks
+class TickController:
+    def __init__(self, engine, tick_rate=60, fall_delay=500, initial_delay=100, auto_repeat_rate=50, act=None, profiler=None):
+        self.engine = engine
+        self.act = act if act is not None else engine.act
+        self.profiler = profiler if profiler is not None else Profiler(enabled=False)
+        self.fall_delay = to_ticks(fall_delay, tick_rate)
+        self.initial_delay = to_ticks(initial_delay, tick_rate)
+        self.auto_repeat_rate = to_ticks(auto_repeat_rate, tick_rate)
+
+        self.tick_count = 0
+        self.last_fall_tick = 0
+        self.das = {action: {"active": False, "start": 0, "last": 0} for action in ("left", "right", "down")}
+
+    # Advance the game by one tick. pressed lists the one-shot inputs since the
+    # last tick (rotations, hold, hard drop), held is the set of movement
+    # inputs whose keys are down.
+    def tick(self, held=(), pressed=()):
+        self.tick_count += 1
+        now = self.tick_count
+
+        for action in pressed:
+            self.act(action)
+        self.profiler.lap("inputs")
+
+        # Handle DAS for each movement
+        for action, das in self.das.items():
+            if action not in held:
+                das["active"] = False
+            elif not das["active"]:
+                if self.act(action):
+                    das["active"] = True
+                    das["start"] = now
+            elif now - das["start"] >= self.initial_delay and now - das["last"] >= self.auto_repeat_rate:
+                if self.act(action):
+                    das["last"] = now
+        self.profiler.lap("das")
+
+        # Update the game state
+        if now - self.last_fall_tick >= self.fall_delay:
+            self.act("step")
+            self.last_fall_tick = now
+        self.profiler.lap("gravity")
+
+    # How far the piece is through its current fall, from 0 to 1, at a fraction alpha into the next tick
+    def fall_progress(self, alpha=0.0):
+        return min(1.0, (self.tick_count - self.last_fall_tick + alpha) / self.fall_delay)
@@ -0,0 +1,298 @@
+'''
+Host matches over the network for players and spectators.
+
+One asyncio process runs any number of matches. A match has a few player
+seats, each with its own TetrisEngine on the same seed, driven by the
+fixed-timestep TickController; players send inputs, and everyone subscribed
+to the match (players and spectators alike) receives its state.
+
+The protocol is newline-delimited JSON over TCP. A client first sends
+
+    {"type": "join", "match": "name", "role": "player" or "spectator", "seed": 1}
+
+and gets back a "full" message with every board, then one "delta" message
+per server step in which something changed. A delta lists, per board, only
+the rows that changed and the piece, preview, hold, score and game-over
+fields that changed. It is encoded once per match and the same bytes are
+written to every subscriber, so serving more spectators costs a socket
+write each, not a frame encode each. A subscriber that cannot keep up stops
+receiving deltas until its socket buffer drains, then gets a fresh full
+message.
+
+Players send {"type": "input", "action": "left"} with any name from
+engine.inputs.
+
+    python server.py --port 7777
+    python server.py --connect 127.0.0.1:7777 --match demo --spectate
+'''
+
+import argparse
+import asyncio
+import json
+
+import numpy as np
+
+from engine import TetrisEngine, inputs
+from scheduler import TickController, TickScheduler
+
+# Describe the state of one board as it is sent to clients
+def board_state(engine):
+    position = engine.current_position
+    return {
+        "grid": engine.grid.copy(),
+        "board_hash": engine.board_hash,
+        "piece": [engine.current_tetromino_key, engine.rotation_state, int(position[0]), int(position[1])],
+        "next": engine.next_tetromino_key,
+        "hold": engine.hold_tetromino_key,
+        "score": engine.score,
+        "game_over": engine.game_over
+    }
+
+# Encode a message as one line of JSON
+def encode(message):
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+# Define a match: its boards, their controllers and who is watching
+class Match:
+    def __init__(self, name, seed=0, players=2, tick_rate=60, fall_delay=500):
+        self.name = name
+        self.seed = seed
+        self.tick = 0
+        self.engines = [TetrisEngine(seed) for _ in range(players)]
+        self.controllers = [TickController(engine, tick_rate, fall_delay) for engine in self.engines]
+        self.inputs = [[] for _ in range(players)]
+        self.seats = [None] * players
+        self.subscribers = set()
+        self.resync = set()
+        self.sent = [board_state(engine) for engine in self.engines]
+
+    # Give a writer the first free player seat, returning its index or None
+    def take_seat(self, writer):
+        for index, seat in enumerate(self.seats):
+            if seat is None:
+                self.seats[index] = writer
+                return index
+        return None
+
+    def leave(self, writer):
+        self.subscribers.discard(writer)
+        self.resync.discard(writer)
+        self.seats = [None if seat is writer else seat for seat in self.seats]
+
+    # Advance every board by one tick, applying the inputs received since the last one
+    def step(self):
+        self.tick += 1
+        for controller, pending in zip(self.controllers, self.inputs):
+            controller.tick(pressed=pending)
+            pending.clear()
+
+    # Every board in full, for a new or resynchronising subscriber
+    def full(self):
+        boards = []
+        for state in self.sent:
+            board = {name: value for name, value in state.items() if name not in ("grid", "board_hash")}
+            board["grid"] = state["grid"].tolist()
+            boards.append(board)
+        return {"type": "full", "match": self.name, "tick": self.tick, "boards": boards}
+
+    # What changed on every board since the last delta, or None if nothing did
+    def delta(self):
+        boards = {}
+        for index, engine in enumerate(self.engines):
+            old = self.sent[index]
+            new = board_state(engine)
+            changes = {name: new[name] for name in ("piece", "next", "hold", "score", "game_over") if new[name] != old[name]}
+            # The board hash tells cheaply whether any row can have changed
+            if new["board_hash"] != old["board_hash"]:
+                rows = np.flatnonzero((new["grid"] != old["grid"]).any(axis=1))
+                changes["rows"] = {str(i): new["grid"][i].tolist() for i in rows}
+            if changes:
+                boards[str(index)] = changes
+            self.sent[index] = new
+        if not boards:
+            return None
+        return {"type": "delta", "tick": self.tick, "boards": boards}
+
+# Define the server hosting every match
+class MatchServer:
+    def __init__(self, tick_rate=60, fall_delay=500, players=2, max_buffer=256 * 1024):
+        self.tick_rate = tick_rate
+        self.fall_delay = fall_delay
+        self.players = players
+        self.max_buffer = max_buffer
+        self.matches = {}
+        self.connections = {}  # writer -> the task serving it
+        self.server = None
+        self.ticker = None
+
+    def get_match(self, name, seed):
+        match = self.matches.get(name)
+        if match is None:
+            match = self.matches[name] = Match(name, seed, self.players, self.tick_rate, self.fall_delay)
+        return match
+
+    # Serve one connection: a join, then inputs until it closes
+    async def handle(self, reader, writer):
+        match = None
+        self.connections[writer] = asyncio.current_task()
+        try:
+            join = json.loads(await reader.readline() or "null")
+            if not isinstance(join, dict) or join.get("type") != "join":
+                writer.write(encode({"type": "error", "error": "expected a join message"}))
+                return
+            seed = join.get("seed", 0)
+            if not isinstance(seed, int) or isinstance(seed, bool):
+                writer.write(encode({"type": "error", "error": "the seed must be an integer"}))
+                return
+            match = self.get_match(str(join.get("match", "default")), seed)
+            seat = match.take_seat(writer) if join.get("role") == "player" else None
+            writer.write(encode({"type": "joined", "match": match.name, "seat": seat}))
+            writer.write(encode(match.full()))
+            match.subscribers.add(writer)
+
+            async for line in reader:
+                message = json.loads(line)
+                if not isinstance(message, dict):
+                    continue  # Skip anything that is not a message object
+                if seat is not None and message.get("type") == "input" and message.get("action") in inputs:
+                    match.inputs[seat].append(message["action"])
+        except (ConnectionError, json.JSONDecodeError, ValueError):
+            pass
+        finally:
+            if match is not None:
+                match.leave(writer)
+                if not match.subscribers:
+                    self.matches.pop(match.name, None)
+            self.connections.pop(writer, None)
+            writer.close()
+
+    # Write a message to every subscriber of a match, holding back the slow ones
+    def broadcast(self, match, message):
+        data = encode(message)
+        full = None
+        for writer in list(match.subscribers):
+            if writer.is_closing():
+                match.leave(writer)
+                continue
+            buffered = writer.transport.get_write_buffer_size()
+            if writer in match.resync:
+                if buffered > self.max_buffer // 2:
+                    continue
+                if full is None:
+                    full = encode(match.full())
+                writer.write(full)
+                match.resync.discard(writer)
+            elif buffered > self.max_buffer:
+                match.resync.add(writer)
+            else:
+                writer.write(data)
+
+    # Run the ticks of every match at the tick rate, broadcasting once per step
+    async def run_ticks(self):
+        loop = asyncio.get_running_loop()
+        scheduler = TickScheduler(self.tick_rate)
+        while True:
+            due = scheduler.advance(loop.time() * 1000)
+            if due:
+                for match in list(self.matches.values()):
+                    for _ in range(due):
+                        match.step()
+                    message = match.delta()
+                    if message is not None:
+                        self.broadcast(match, message)
+            await asyncio.sleep(scheduler.tick_ms / 1000 - scheduler.accumulator / 1000)
+
+    async def start(self, host="127.0.0.1", port=7777):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.ticker = asyncio.create_task(self.run_ticks())
+        return self.server.sockets[0].getsockname()[1]
+
+    # Stop ticking and listening, then close every client connection so that
+    # their handlers finish on their own instead of being cancelled
+    async def stop(self):
+        self.ticker.cancel()
+        self.server.close()
+        tasks = list(self.connections.values())
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+# Define a client that mirrors the boards of a match from the messages it receives
+class MatchClient:
+    def __init__(self):
+        self.boards = []
+        self.tick = 0
+        self.seat = None
+
+    async def connect(self, host, port, match="default", role="spectator", seed=0):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(encode({"type": "join", "match": match, "role": role, "seed": seed}))
+        await self.writer.drain()
+        self.seat = (await self.receive())["seat"]
+        await self.receive()
+        return self
+
+    async def send(self, action):
+        self.writer.write(encode({"type": "input", "action": action}))
+        await self.writer.drain()
+
+    # Read one message and apply it to the mirrored boards
+    async def receive(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("the server closed the connection")
+        message = json.loads(line)
+        if message["type"] == "full":
+            self.boards = message["boards"]
+            for board in self.boards:
+                board["grid"] = np.array(board["grid"])
+        elif message["type"] == "delta":
+            for index, changes in message["boards"].items():
+                board = self.boards[int(index)]
+                for i, row in changes.pop("rows", {}).items():
+                    board["grid"][int(i)] = row
+                board.update(changes)
+        self.tick = message.get("tick", self.tick)
+        return message
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+async def serve(args):
+    server = MatchServer(args.tick_rate, args.fall_delay, args.players)
+    port = await server.start(args.host, args.port)
+    print(f"serving on {args.host}:{port}")
+    await server.server.serve_forever()
+
+async def watch(args):
+    host, port = args.connect.rsplit(":", 1)
+    client = await MatchClient().connect(host, int(port), args.match, "spectator" if args.spectate else "player", args.seed)
+    scores = None
+    while True:
+        await client.receive()
+        current = [board["score"] for board in client.boards]
+        if current != scores:
+            scores = current
+            print(json.dumps({"tick": client.tick, "scores": scores}), flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Host Tetris matches, or watch one.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--tick-rate", type=int, default=60)
+    parser.add_argument("--fall-delay", type=int, default=500, help="milliseconds per gravity step")
+    parser.add_argument("--players", type=int, default=2, help="player seats per match")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="join a server instead of hosting one")
+    parser.add_argument("--match", default="default")
+    parser.add_argument("--seed", type=int, default=0, help="seed of a match created by joining it")
+    parser.add_argument("--spectate", action="store_true", help="watch without taking a seat")
+    args = parser.parse_args()
+    try:
+        asyncio.run(watch(args) if args.connect else serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
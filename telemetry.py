@@ -0,0 +1,190 @@
+'''
+Stream game events to a log file.
+
+TetrisEngine calls its on_event listener when a piece spawns, is held or
+locks, when lines clear and when the game ends. TelemetryWriter is such a
+listener: it stamps each event with the game time and the current TPS and
+appends it to an in-memory queue, which is all the game loop pays for. A
+background thread wakes up every flush_interval seconds, encodes whatever
+has queued up in one batch and writes it out. If the disk falls behind, the
+queue is capped and further events are counted as dropped rather than
+making the game wait. A batch that fails to encode or write is counted as a
+write error and its events as dropped; the thread keeps going, and closing
+the writer never raises into the game.
+
+Two formats are supported, chosen by the file extension: newline-delimited
+JSON (.ndjson, .jsonl, .json) and a compact binary log with one fixed-size record
+per event (anything else). The binary header lists the piece keys of the
+game, and records refer to pieces by their index in that list, so any piece
+set can be logged. read_telemetry reads both back:
+
+    python telemetry.py session.ndjson      # print a summary of a log
+'''
+
+import argparse
+import json
+import struct
+import threading
+import time
+from collections import Counter, deque
+
+from engine import pentominoes, tetrominoes
+
+# Define the binary layout: a header, then one record per event
+magic = b"TTLM"
+version = 3
+header_format = struct.Struct("<4sBB")  # magic, version, number of piece keys (each then as length and UTF-8)
+record_format = struct.Struct("<BIfBBhhBbB")  # kind, time, tps, piece, state, y, x, lines, score delta, other piece
+event_kinds = ("spawn", "hold", "lock", "clear", "game_over")
+default_piece_keys = tuple(tetrominoes) + tuple(key for key in pentominoes if key not in tetrominoes)
+state_codes = (None, "0", "R", "2", "L")
+
+# Tell whether a path is written as newline-delimited JSON
+def is_json_path(path):
+    return path.endswith((".ndjson", ".jsonl", ".json"))
+
+# Encode the header of a binary log for the given piece keys; code 0 is no piece
+def pack_header(piece_keys):
+    if len(piece_keys) > 255:
+        raise ValueError(f"a binary telemetry log holds at most 255 piece keys, not {len(piece_keys)}")
+    names = [str(key).encode() for key in piece_keys]
+    if any(len(name) > 255 for name in names):
+        raise ValueError("a binary telemetry piece key is at most 255 bytes long")
+    return header_format.pack(magic, version, len(names)) + b"".join(bytes([len(name)]) + name for name in names)
+
+# Pack an event into a binary record, given the code of every piece key
+def pack_event(event, codes):
+    position = event.get("position") or (0, 0)
+    other = event.get("held", event.get("next"))
+    return record_format.pack(event_kinds.index(event["kind"]), event["time"], event["tps"],
+                              codes[event.get("piece")], state_codes.index(event.get("state")),
+                              position[0], position[1], event.get("lines", 0), event.get("score_delta", 0),
+                              codes[other])
+
+# Unpack a binary record into an event, given the key of every piece code
+def unpack_event(data, offset, piece_codes):
+    kind, time_ms, tps, piece, state, y, x, lines, score_delta, other = record_format.unpack_from(data, offset)
+    event = {"kind": event_kinds[kind], "time": time_ms, "tps": round(tps, 3), "piece": piece_codes[piece]}
+    if event["kind"] == "lock":
+        event.update(state=state_codes[state], position=[y, x], lines=lines, score_delta=score_delta)
+    elif event["kind"] == "clear":
+        event["lines"] = lines
+    elif event["kind"] == "hold":
+        event["held"] = piece_codes[other]
+    else:
+        event["next"] = piece_codes[other]
+    return event
+
+# Define a listener that writes events from a background thread
+class TelemetryWriter:
+    def __init__(self, path, clock=None, tps=None, flush_interval=0.5, max_pending=100000, piece_keys=default_piece_keys):
+        self.path = path
+        self.json = is_json_path(path)
+        self.codes = {key: code for code, key in enumerate((None,) + tuple(piece_keys))}
+        header = None if self.json else pack_header(piece_keys)
+        self.file = open(path, "w" if self.json else "wb")
+        if header is not None:
+            self.file.write(header)
+        self.clock = clock if clock is not None else lambda: int(time.monotonic() * 1000)
+        self.tps = tps if tps is not None else lambda: 0.0
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        # deque.append and popleft are atomic, so the queue needs no lock
+        self.pending = deque()
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self.last_error = None
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True)
+        self.thread.start()
+
+    # Queue an event (this is the engine's on_event listener)
+    def __call__(self, kind, fields):
+        if not self.json:
+            for name in ("piece", "held", "next"):
+                if name in fields and fields[name] not in self.codes:
+                    raise ValueError(f"piece {fields[name]!r} is not one of the piece keys of {self.path}")
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        event = {"kind": kind, "time": self.clock(), "tps": self.tps()}
+        event.update(fields)
+        self.pending.append(event)
+
+    # Encode and write every queued event in one batch
+    def write_pending(self):
+        batch = []
+        while self.pending:
+            batch.append(self.pending.popleft())
+        if not batch:
+            return
+        try:
+            if self.json:
+                self.file.write("".join(json.dumps(event, separators=(",", ":")) + "\n" for event in batch))
+            else:
+                self.file.write(b"".join(pack_event(event, self.codes) for event in batch))
+            self.file.flush()
+        except Exception as error:
+            self.write_errors += 1
+            self.dropped += len(batch)
+            self.last_error = error
+            return
+        self.written += len(batch)
+
+    def run(self):
+        while not self.stopping.wait(self.flush_interval):
+            self.write_pending()
+
+    # Stop the thread, write what is left and close the file
+    def close(self):
+        self.stopping.set()
+        self.thread.join()
+        self.write_pending()
+        try:
+            self.file.close()
+        except OSError as error:
+            self.write_errors += 1
+            self.last_error = error
+
+# Read the events of a log back, in either format
+def read_telemetry(path):
+    if is_json_path(path):
+        with open(path) as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < header_format.size:
+        raise ValueError(f"{path} is not a version {version} telemetry log")
+    file_magic, file_version, key_count = header_format.unpack_from(data, 0)
+    if file_magic != magic or file_version != version:
+        raise ValueError(f"{path} is not a version {version} telemetry log")
+
+    # Read the piece keys the records refer to
+    piece_codes = [None]
+    offset = header_format.size
+    for _ in range(key_count):
+        if offset >= len(data) or offset + 1 + data[offset] > len(data):
+            raise ValueError(f"{path} is not a version {version} telemetry log")
+        piece_codes.append(data[offset + 1:offset + 1 + data[offset]].decode())
+        offset += 1 + data[offset]
+
+    count = (len(data) - offset) // record_format.size
+    return [unpack_event(data, offset + i * record_format.size, piece_codes) for i in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize telemetry logs.")
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        events = read_telemetry(path)
+        kinds = Counter(event["kind"] for event in events)
+        lines = sum(event.get("lines", 0) for event in events if event["kind"] == "clear")
+        duration = (events[-1]["time"] - events[0]["time"]) / 1000 if events else 0
+        print(json.dumps({"path": path, "events": len(events), "kinds": kinds, "lines": lines, "seconds": duration}))
+
+if __name__ == "__main__":
+    main()
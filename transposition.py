@@ -0,0 +1,147 @@
+'''
+Zobrist hashing of game positions and a bounded transposition table.
+
+Every (row, column) cell has a random 64-bit key and a board hashes to the
+XOR of the keys of its filled cells, so locking a piece updates the hash with
+four XORs (engine.py keeps TetrisEngine.board_hash that way). state_hash adds
+the falling piece, the preview, the hold slot and what is left in the 7-bag,
+which is everything a lookahead search needs to recognise a position it has
+already scored through another move order.
+
+TranspositionTable stores scores in a fixed number of slots chosen from a
+memory cap, so it never grows during a search. When two positions want the
+same slot the replacement policy decides which one stays; hits, misses,
+stores and evictions are counted to help size the table.
+'''
+
+import random
+
+import numpy as np
+
+# Define the tetromino keys hashed in the piece part of a state
+piece_keys = ('I', 'O', 'T', 'S', 'Z', 'J', 'L')
+
+# Define the random keys, drawn once from a fixed seed so hashes are stable between runs
+zobrist_rng = random.Random(0x7E7812)
+zobrist = {
+    "current": {key: zobrist_rng.getrandbits(64) for key in piece_keys},
+    "next": {key: zobrist_rng.getrandbits(64) for key in piece_keys},
+    "hold": {key: zobrist_rng.getrandbits(64) for key in piece_keys + (None,)},
+    "bag": {key: zobrist_rng.getrandbits(64) for key in piece_keys},
+    "hold_used": zobrist_rng.getrandbits(64)
+}
+cell_key_tables = {}
+
+# Get the key of a piece in one part of the state, drawing keys for pieces
+# outside the tetromino set (see engine.piece_sets) the first time they are seen
+def piece_zobrist(kind, key):
+    keys = zobrist[kind]
+    value = keys.get(key)
+    if value is None:
+        value = keys[key] = random.Random(f"{kind}:{key}").getrandbits(64)
+    return value
+
+# Get the cell keys of a board size, as a NumPy array and as nested lists of ints
+def cell_keys(height, width):
+    tables = cell_key_tables.get((height, width))
+    if tables is None:
+        rng = random.Random(height * 1000 + width)
+        array = np.array([[rng.getrandbits(64) for _ in range(width)] for _ in range(height)], dtype=np.uint64)
+        tables = cell_key_tables[(height, width)] = (array, array.tolist())
+    return tables
+
+# Hash a whole grid from scratch. A grid holding only the bottom rows of a
+# taller board (whose rows above are empty) is hashed with the keys of that
+# board, given its height, so it hashes the same as the whole board.
+def grid_hash(grid, height=None):
+    array, _ = cell_keys(height or grid.shape[0], grid.shape[1])
+    array = array[array.shape[0] - grid.shape[0]:]
+    return int(np.bitwise_xor.reduce(array[grid != 0], initial=np.uint64(0)))
+
+# Toggle the cells of an orientation (see orientations) at a position in a
+# board hash; filling and emptying the same cells are the same operation
+def toggle_cells(board_hash, cells, position, shape):
+    _, keys = cell_keys(*shape)
+    y, x = position
+    for i, j in cells:
+        board_hash ^= keys[y + i][x + j]
+    return board_hash
+
+# Hash the full game state of an engine: its board and the pieces it can still play
+def state_hash(engine):
+    result = engine.board_hash ^ piece_zobrist("current", engine.current_tetromino_key)
+    result ^= piece_zobrist("next", engine.next_tetromino_key) ^ piece_zobrist("hold", engine.hold_tetromino_key)
+    for key in engine.bag:
+        result ^= piece_zobrist("bag", key)
+    if engine.hold_used:
+        result ^= zobrist["hold_used"]
+    return result
+
+# Define the replacement policies: each decides whether a new entry
+# (with its search depth) may take a slot from an old one
+replacement_policies = {
+    "always": lambda new_depth, old_depth: True,
+    "depth": lambda new_depth, old_depth: new_depth >= old_depth,
+    "keep": lambda new_depth, old_depth: False
+}
+
+# Define a fixed-size table from position hashes to scores
+class TranspositionTable:
+    # Rough size of one slot: its share of the three lists plus the int and float objects
+    entry_bytes = 96
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, policy="depth", size=None):
+        if policy not in replacement_policies:
+            raise ValueError(f"unknown replacement policy {policy!r}, expected one of {sorted(replacement_policies)}")
+        self.size = size if size is not None else max(1, max_bytes // self.entry_bytes)
+        self.policy = policy
+        self.replace = replacement_policies[policy]
+        self.clear()
+
+    # Empty the table and reset its counters
+    def clear(self):
+        self.keys = [None] * self.size
+        self.values = [None] * self.size
+        self.depths = [0] * self.size
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    # Look up a position searched at least min_depth deep, returning None on a miss
+    def get(self, key, min_depth=0):
+        slot = key % self.size
+        if self.keys[slot] == key and self.depths[slot] >= min_depth:
+            self.hits += 1
+            return self.values[slot]
+        self.misses += 1
+        return None
+
+    # Store the score of a position, unless the policy keeps the entry already in its slot
+    def put(self, key, value, depth=0):
+        slot = key % self.size
+        old_key = self.keys[slot]
+        if old_key is not None and old_key != key:
+            if not self.replace(depth, self.depths[slot]):
+                return False
+            self.evictions += 1
+        self.keys[slot] = key
+        self.values[slot] = value
+        self.depths[slot] = depth
+        self.stores += 1
+        return True
+
+    def __len__(self):
+        return self.size - self.keys.count(None)
+
+    def counters(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size,
+            "used": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }